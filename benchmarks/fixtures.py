@@ -0,0 +1,277 @@
+"""
+Synthetic fixtures for the pyneng benchmarks: chapters with any number of
+tasks, pytest reports and local bare git repositories that stand in for the
+tasks and answers repositories on GitHub. Nothing is downloaded, so the
+benchmarks run offline.
+"""
+
+import os
+import shutil
+import subprocess
+from types import SimpleNamespace
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "pyneng-bench",
+    "GIT_AUTHOR_EMAIL": "pyneng-bench@example.com",
+    "GIT_COMMITTER_NAME": "pyneng-bench",
+    "GIT_COMMITTER_EMAIL": "pyneng-bench@example.com",
+}
+# every LETTERS_EVERY task also has versions with letters (task_4_5a.py ...)
+LETTERS_EVERY = 5
+LETTERS = "ab"
+
+
+def git(*args, cwd=None):
+    subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        env={**os.environ, **GIT_ENV},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+def task_ids(tasks):
+    """
+    Task ids of a synthetic chapter with tasks numbered tasks: 1, 2, ..., 5,
+    5a, 5b, 6, ...
+    """
+    ids = []
+    for number in range(1, tasks + 1):
+        ids.append(str(number))
+        if number % LETTERS_EVERY == 0:
+            ids.extend(f"{number}{letter}" for letter in LETTERS)
+    return ids
+
+
+def chapter_files(chapter_id, tasks, version=1):
+    """
+    Returns a dict {file name: content} with task and test files of a chapter.
+    The content depends on version, so that a new version of the chapter
+    changes all files.
+    """
+    files = {}
+    for task_id in task_ids(tasks):
+        task = f"task_{chapter_id}_{task_id}.py"
+        files[task] = f"# task {chapter_id}.{task_id} version {version}\n"
+        files[f"test_{task}"] = (
+            f"# version {version}\n"
+            f"def test_task_{chapter_id}_{task_id}():\n"
+            "    assert True\n"
+        )
+    files["conftest.py"] = f"# version {version}\n"
+    return files
+
+
+def answer_files(chapter_id, tasks):
+    return {
+        f"task_{chapter_id}_{task_id}.py": f"# answer {chapter_id}.{task_id}\n"
+        for task_id in task_ids(tasks)
+    }
+
+
+def write_files(path, files):
+    for name, content in files.items():
+        filename = os.path.join(path, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as f:
+            f.write(content)
+
+
+def make_chapter(path, chapter_id, tasks, version=1):
+    """
+    Creates a chapter directory with task and test files.
+    """
+    os.makedirs(path, exist_ok=True)
+    write_files(path, chapter_files(chapter_id, tasks, version))
+    return path
+
+
+def make_bare_repo(path, commits):
+    """
+    Creates a bare repository in path. commits is a list of dicts
+    {file path: content}, each dict is committed on top of the previous one.
+    Returns file:// URL of the repository.
+    """
+    work_dir = f"{path}.work"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(work_dir)
+    git("init", "-q", "-b", "main", cwd=work_dir)
+    for number, files in enumerate(commits, 1):
+        write_files(work_dir, files)
+        git("add", "-A", cwd=work_dir)
+        git("commit", "-q", "-m", f"commit {number}", cwd=work_dir)
+    git("clone", "-q", "--bare", work_dir, path)
+    # shallow and blob-less clones as from GitHub
+    git("config", "uploadpack.allowFilter", "true", cwd=path)
+    shutil.rmtree(work_dir)
+    return f"file://{os.path.abspath(path)}"
+
+
+def chapter_commit(prefix, chapters, tasks, version=1):
+    files = {}
+    for chapter_id, chapter in chapters.items():
+        for name, content in chapter_files(chapter_id, tasks, version).items():
+            files[f"{prefix}/{chapter}/{name}"] = content
+    return files
+
+
+def make_tasks_repo(path, chapters, tasks):
+    """
+    Tasks repository with two commits: the second one changes every fifth
+    task of each chapter (what students get with pyneng --update).
+    chapters is a dict {chapter id: chapter directory name}.
+    """
+    first = chapter_commit("exercises", chapters, tasks, version=1)
+    second = {
+        name: content.replace("version 1", "version 2")
+        for name, content in first.items()
+        if name.endswith("0.py") or name.endswith("5.py")
+    }
+    return make_bare_repo(path, [first, second])
+
+
+def make_answers_repo(path, chapters, tasks):
+    files = {}
+    for chapter_id, chapter in chapters.items():
+        for name, content in answer_files(chapter_id, tasks).items():
+            files[f"answers/{chapter}/{name}"] = content
+    return make_bare_repo(path, [files])
+
+
+def make_student_repo(path, chapters, tasks):
+    """
+    Student repository with the first version of the chapters in exercises
+    directory (as it was copied before the tasks were updated). Returns the
+    path of the exercises directory.
+    """
+    shutil.rmtree(path, ignore_errors=True)
+    exercises = os.path.join(path, "exercises")
+    for chapter_id, chapter in chapters.items():
+        make_chapter(os.path.join(exercises, chapter), chapter_id, tasks)
+    git("init", "-q", "-b", "main", cwd=path)
+    git("add", "-A", cwd=path)
+    git("commit", "-q", "-m", "initial", cwd=path)
+    return exercises
+
+
+def reset_student_repo(path):
+    git("reset", "-q", "--hard", cwd=path)
+    git("clean", "-q", "-fdx", cwd=path)
+
+
+def make_reports(test_files, tests_per_file, failed_every=7):
+    """
+    Returns a list of objects with the attributes of pytest TestReport
+    (setup, call and teardown report for each test) for ResultsCollector.
+    Every failed_every test fails.
+    """
+    # the crash line of a failed test (ResultsCollector adds it to failures)
+    failure = SimpleNamespace(reprcrash=SimpleNamespace(message="assert 1 == 2"))
+    reports = []
+    number = 0
+    for file_number in range(test_files):
+        test_file = f"test_task_4_{file_number + 1}.py"
+        for test_number in range(tests_per_file):
+            number += 1
+            nodeid = f"{test_file}::test_{test_number}"
+            call_outcome = "failed" if number % failed_every == 0 else "passed"
+            for when, outcome in (
+                ("setup", "passed"),
+                ("call", call_outcome),
+                ("teardown", "passed"),
+            ):
+                reports.append(
+                    SimpleNamespace(
+                        nodeid=nodeid,
+                        when=when,
+                        duration=0.001,
+                        outcome=outcome,
+                        passed=outcome == "passed",
+                        failed=outcome == "failed",
+                        skipped=False,
+                        longrepr=failure if outcome == "failed" else None,
+                    )
+                )
+    return reports
+
+
+# templates of 20_jinja2 and 21_textfsm sized like the templates of the tasks
+TEXTFSM_TEMPLATE = r"""Value Filldown HOSTNAME (\S+)
+Value INTF (\S+)
+Value ADDRESS (\S+)
+Value STATUS (up|down|administratively down)
+Value PROTOCOL (up|down)
+
+Start
+  ^${HOSTNAME}[>#]
+  ^${INTF}\s+${ADDRESS}\s+\w+\s+\w+\s+${STATUS}\s+${PROTOCOL} -> Record
+"""
+JINJA2_TEMPLATE = """hostname {{ name }}
+!
+{% for vlan, vlan_name in vlans.items() %}
+vlan {{ vlan }}
+ name {{ vlan_name }}
+{% endfor %}
+{% for intf, params in access.items() %}
+interface {{ intf }}
+ switchport mode access
+ switchport access vlan {{ params.vlan }}
+{% if params.description %}
+ description {{ params.description }}
+{% endif %}
+{% endfor %}
+{% if ospf %}
+router ospf {{ ospf.process }}
+{% for network in ospf.networks %}
+ network {{ network }} 0.0.0.255 area 0
+{% endfor %}
+{% endif %}
+"""
+JINJA2_DATA = {
+    "name": "SW1",
+    "vlans": {10: "Marketing", 20: "Voice", 30: "Management"},
+    "access": {
+        f"Fa0/{n}": {"vlan": 10 * (n % 3 + 1), "description": f"port {n}"}
+        for n in range(8)
+    },
+    "ospf": {"process": 1, "networks": ["10.0.1.0", "10.0.2.0"]},
+}
+
+
+def make_history_records(repos, tasks, runs, tests=5, failed_every=4):
+    """
+    Run history records (see pyneng_cli.history.task_records) of repos
+    repositories with tasks tasks (10 tasks per chapter), each task was run
+    runs times. Every failed_every run of a task fails its first test.
+    """
+    records = []
+    for repo in range(repos):
+        for task in range(tasks):
+            chapter = 4 + task // 10
+            path = f"/srv/students/s{repo}/exercises/{chapter:02d}_chapter"
+            task_hash = f"{repo:08x}{task:08x}"
+            for run in range(runs):
+                outcome = "failed" if run % failed_every == 0 else "passed"
+                test_runs = [
+                    (
+                        f"test_{n}",
+                        "passed" if n or outcome == "passed" else "failed",
+                        0.01,
+                    )
+                    for n in range(tests)
+                ]
+                records.append(
+                    (
+                        path,
+                        f"{chapter}.{task % 10 + 1}",
+                        1_700_000_000 + run * 60 + task,
+                        task_hash,
+                        outcome,
+                        0.05 * tests,
+                        test_runs,
+                    )
+                )
+    return records
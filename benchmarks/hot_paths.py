@@ -0,0 +1,303 @@
+"""
+Benchmarks of pyneng hot paths on synthetic data (see fixtures.py):
+
+* task selectors (_get_tasks_tests_from_cli) on chapters with 10-500 tasks
+* collecting the results of thousands of tests (ResultsCollector)
+* copy_answers, update_tasks_and_tests and update_chapters_tasks_and_tests
+  against local bare repositories that stand in for ANSWERS_URL and
+  LANG_TASKS_URL. "cold" - the local repository caches do not exist,
+  "warm" - the caches are fresh (the usual case within PYNENG_CACHE_TTL)
+* pyneng_cli.history: writing the records of a run and pyneng --stats
+  queries on a history of HISTORY_REPOS repositories (100 000 task runs)
+* TextFSM templates parsed and Jinja2 templates compiled again for each
+  call, as the tasks of 20_jinja2 and 21_textfsm do, with
+  pyneng_cli.template_cache
+
+HOME and PYNENG_CACHE_DIR point to a temporary directory, so the benchmarks
+do not touch the real caches. The median time of each benchmark is compared
+with baselines.json.
+
+    python benchmarks/hot_paths.py
+    python benchmarks/hot_paths.py -k selector --repeat 20
+    python benchmarks/hot_paths.py --update-baseline
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import fixtures
+from import_time import load_baselines, save_baselines
+
+# allowed slowdown compared to the baseline (git operations are noisy)
+TOLERANCE = 0.5
+SELECTOR_CHAPTER_SIZES = [10, 100, 500]
+SELECTORS = {"all": "all", "mixed": "1,3-8,5a-b,10*"}
+RESULTS_SIZES = [1000, 5000]
+TESTS_PER_FILE = 10
+GIT_CHAPTERS = {4: "04_data_structures", 5: "05_basic_scripts"}
+GIT_CHAPTER_TASKS = 40
+TEMPLATE_CALLS = 100
+HISTORY_REPOS = 100
+HISTORY_TASKS = 100
+HISTORY_RUNS = 10
+
+
+class Benchmark:
+    """
+    run is timed, setup (if set) is called before each run and is not timed.
+    """
+
+    def __init__(self, name, run, setup=None, cwd=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.cwd = cwd
+
+    def measure(self, repeat):
+        timings = []
+        for _ in range(repeat):
+            if self.setup:
+                self.setup()
+            start = time.perf_counter()
+            self.run()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+
+@contextlib.contextmanager
+def quiet(answers="n"):
+    """
+    Suppresses the output and answers answers to all input() prompts.
+    """
+    stdin = sys.stdin
+    sys.stdin = io.StringIO(f"{answers}\n" * 1000)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        sys.stdin = stdin
+
+
+def selector_benchmarks(workspace):
+    from pyneng_cli.pyneng import CustomTasksType, _get_tasks_tests_from_cli
+
+    benchmarks = []
+    for size in SELECTOR_CHAPTER_SIZES:
+        chapter_dir = fixtures.make_chapter(
+            os.path.join(workspace, f"selector_{size}", "04_data_structures"), 4, size
+        )
+        for selector_name, selector in SELECTORS.items():
+
+            def run(selector=selector, chapter_dir=chapter_dir):
+                _get_tasks_tests_from_cli(CustomTasksType(), selector, chapter_dir)
+
+            benchmarks.append(Benchmark(f"selector_{selector_name}_{size}", run))
+    return benchmarks
+
+
+def results_benchmarks(workspace):
+    from pyneng_cli.results import ResultsCollector, get_passed_tasks
+
+    benchmarks = []
+    for size in RESULTS_SIZES:
+        reports = fixtures.make_reports(size // TESTS_PER_FILE, TESTS_PER_FILE)
+
+        def run(reports=reports):
+            collector = ResultsCollector()
+            for report in reports:
+                collector.pytest_runtest_logreport(report)
+            get_passed_tasks(collector.results)
+
+        benchmarks.append(Benchmark(f"results_{size}", run))
+    return benchmarks
+
+
+def git_benchmarks(workspace):
+    import pyneng_cli.utils as utils
+    from pyneng_cli import ANSWERS_LOCAL_REPO, CACHE_DIR, LANG_TASKS_LOCAL_REPO
+
+    tasks_url = fixtures.make_tasks_repo(
+        os.path.join(workspace, "tasks.git"), GIT_CHAPTERS, GIT_CHAPTER_TASKS
+    )
+    answers_url = fixtures.make_answers_repo(
+        os.path.join(workspace, "answers.git"), GIT_CHAPTERS, GIT_CHAPTER_TASKS
+    )
+    # local repositories stand in for GitHub
+    utils.ANSWERS_URL = answers_url
+    utils.LANG_TASKS_URL = dict.fromkeys(utils.LANG_TASKS_URL, tasks_url)
+
+    student_dir = os.path.join(workspace, "student")
+    exercises = fixtures.make_student_repo(student_dir, GIT_CHAPTERS, GIT_CHAPTER_TASKS)
+    chapter_dir = os.path.join(exercises, GIT_CHAPTERS[4])
+    home = os.path.expanduser("~")
+    answers_cache = os.path.join(home, ANSWERS_LOCAL_REPO)
+    tasks_cache = os.path.join(home, LANG_TASKS_LOCAL_REPO["uk"])
+    chapter_ids = fixtures.task_ids(GIT_CHAPTER_TASKS)
+    passed_tasks = [f"test_task_4_{task_id}.py" for task_id in chapter_ids]
+    tasks = [f"task_4_{task_id}.py" for task_id in chapter_ids]
+    tests = [f"test_{task}" for task in tasks]
+
+    def reset_student():
+        fixtures.reset_student_repo(student_dir)
+
+    def cold(*caches):
+        def setup():
+            reset_student()
+            for cache in caches:
+                shutil.rmtree(cache, ignore_errors=True)
+
+        return setup
+
+    def copy_answers():
+        with quiet():
+            utils.copy_answers(passed_tasks)
+
+    def update_tasks():
+        with quiet():
+            utils.update_tasks_and_tests(tasks, tests, lang="uk")
+
+    def update_chapters():
+        with quiet():
+            utils.update_chapters_tasks_and_tests(list(GIT_CHAPTERS.values()), "uk")
+
+    chapter_sync_state = os.path.join(CACHE_DIR, "chapter_sync")
+    return [
+        Benchmark("copy_answers_cold", copy_answers, cold(answers_cache), chapter_dir),
+        Benchmark("copy_answers_warm", copy_answers, reset_student, chapter_dir),
+        Benchmark("update_tasks_cold", update_tasks, cold(tasks_cache), chapter_dir),
+        Benchmark("update_tasks_warm", update_tasks, reset_student, chapter_dir),
+        Benchmark(
+            "update_chapters_cold",
+            update_chapters,
+            cold(tasks_cache, chapter_sync_state),
+            exercises,
+        ),
+        Benchmark("update_chapters_warm", update_chapters, reset_student, exercises),
+    ]
+
+
+def history_benchmarks(workspace):
+    from pyneng_cli import history
+
+    connection = history.connect(os.path.join(workspace, "history.sqlite"))
+    history.write_records(
+        connection,
+        fixtures.make_history_records(HISTORY_REPOS, HISTORY_TASKS, HISTORY_RUNS),
+    )
+    run_records = fixtures.make_history_records(1, HISTORY_TASKS, 1)
+
+    def save_run():
+        history.write_records(connection, run_records)
+
+    def stats(path):
+        return lambda: history.query_stats(connection, path)
+
+    return [
+        Benchmark(f"history_save_{HISTORY_TASKS}", save_run),
+        Benchmark("history_stats_repo", stats("/srv/students/s1")),
+        Benchmark("history_stats_all", stats("/srv/students")),
+    ]
+
+
+def template_benchmarks(workspace):
+    from jinja2 import Environment, FileSystemLoader
+    import textfsm
+    from pyneng_cli.template_cache import install
+
+    template_dir = os.path.join(workspace, "templates")
+    fixtures.write_files(
+        template_dir,
+        {
+            "sh_ip_int_br.template": fixtures.TEXTFSM_TEMPLATE,
+            "switch.txt": fixtures.JINJA2_TEMPLATE,
+        },
+    )
+    install(os.path.join(workspace, "templates_cache"))
+
+    def parse_textfsm():
+        for _ in range(TEMPLATE_CALLS):
+            path = os.path.join(template_dir, "sh_ip_int_br.template")
+            with open(path) as f:
+                textfsm.TextFSM(f)
+
+    def render_jinja2():
+        for _ in range(TEMPLATE_CALLS):
+            env = Environment(loader=FileSystemLoader(template_dir), trim_blocks=True)
+            env.get_template("switch.txt").render(fixtures.JINJA2_DATA)
+
+    return [
+        Benchmark(f"templates_textfsm_{TEMPLATE_CALLS}", parse_textfsm),
+        Benchmark(f"templates_jinja2_{TEMPLATE_CALLS}", render_jinja2),
+    ]
+
+
+# template_benchmarks installs the template caches in this process, so it
+# is the last group
+BENCHMARK_GROUPS = [
+    selector_benchmarks,
+    results_benchmarks,
+    git_benchmarks,
+    history_benchmarks,
+    template_benchmarks,
+]
+
+
+def run(repeat=7, update_baseline=False, keyword=None):
+    workspace = tempfile.mkdtemp(prefix="pyneng-bench-")
+    # pyneng caches (repositories in HOME, CACHE_DIR) are created in the
+    # workspace. CACHE_DIR is read when pyneng_cli is imported
+    os.environ["HOME"] = os.path.join(workspace, "home")
+    os.environ["PYNENG_CACHE_DIR"] = os.path.join(workspace, "cache")
+    os.makedirs(os.environ["HOME"])
+    start_dir = os.getcwd()
+
+    baselines = load_baselines()
+    failed = False
+    try:
+        for group in BENCHMARK_GROUPS:
+            for benchmark in group(workspace):
+                if keyword and keyword not in benchmark.name:
+                    continue
+                os.chdir(benchmark.cwd or start_dir)
+                median = benchmark.measure(repeat)
+                line = f"{benchmark.name:<24} {median * 1000:10.3f} ms"
+                name = f"hot_paths.{benchmark.name}"
+                if update_baseline:
+                    baselines[name] = {"median_us": round(median * 1e6)}
+                elif name in baselines:
+                    baseline = baselines[name]["median_us"] / 1e6
+                    change = (median - baseline) / baseline
+                    line += f"  baseline {baseline * 1000:10.3f} ms {change:+.0%}"
+                    if change > TOLERANCE:
+                        line += f"  FAIL: more than {TOLERANCE:.0%} slower"
+                        failed = True
+                print(line)
+    finally:
+        os.chdir(start_dir)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    if update_baseline:
+        save_baselines(baselines)
+        print("Baselines updated")
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pyneng hot path benchmarks")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "-k", dest="keyword", help="run only the benchmarks with keyword in the name"
+    )
+    args = parser.parse_args()
+    ok = run(
+        repeat=args.repeat, update_baseline=args.update_baseline, keyword=args.keyword
+    )
+    sys.exit(0 if ok else 1)
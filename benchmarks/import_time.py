@@ -0,0 +1,103 @@
+"""
+Import time regression benchmark for pyneng CLI.
+
+Runs ``python -X importtime -c "import pyneng_cli.pyneng"`` several times,
+compares the median cumulative import time with the baseline from
+baselines.json and checks that heavy dependencies are not imported at startup.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --update-baseline
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BASELINES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baselines.json"
+)
+BENCHMARK_NAME = "import_time"
+ENTRY_MODULE = "pyneng_cli.pyneng"
+# modules that must be imported only on the code path that needs them
+DEFERRED_MODULES = ["pytest", "_pytest", "pytest_jsonreport", "rich", "github"]
+# allowed slowdown compared to the baseline
+TOLERANCE = 0.3
+
+
+def measure_import_time(module=ENTRY_MODULE):
+    """
+    Returns the cumulative import time of module in microseconds and the set
+    of all top level packages imported with it.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+        check=True,
+    )
+    cumulative = None
+    imported = set()
+    regex = r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)"
+    for match in re.finditer(regex, result.stderr):
+        name = match.group(4)
+        imported.add(name.split(".")[0])
+        if name == module:
+            cumulative = int(match.group(2))
+    return cumulative, imported
+
+
+def load_baselines():
+    try:
+        with open(BASELINES_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baselines):
+    with open(BASELINES_FILE, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def run(repeat=7, update_baseline=False):
+    timings = []
+    imported = set()
+    for _ in range(repeat):
+        cumulative, imported = measure_import_time()
+        timings.append(cumulative)
+    median = statistics.median(timings)
+    print(f"{ENTRY_MODULE} import time: median {median / 1000:.1f} ms ({repeat} runs)")
+
+    failed = False
+    heavy_imports = sorted(imported & set(DEFERRED_MODULES))
+    if heavy_imports:
+        print(f"FAIL: imported at startup: {', '.join(heavy_imports)}")
+        failed = True
+
+    baselines = load_baselines()
+    if update_baseline:
+        baselines[BENCHMARK_NAME] = {"median_us": median}
+        save_baselines(baselines)
+        print(f"Baseline updated in {BASELINES_FILE}")
+    elif BENCHMARK_NAME in baselines:
+        baseline = baselines[BENCHMARK_NAME]["median_us"]
+        change = (median - baseline) / baseline
+        print(f"baseline {baseline / 1000:.1f} ms, change {change:+.0%}")
+        if change > TOLERANCE:
+            print(f"FAIL: import time is more than {TOLERANCE:.0%} slower")
+            failed = True
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pyneng import time benchmark")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+    ok = run(repeat=args.repeat, update_baseline=args.update_baseline)
+    sys.exit(0 if ok else 1)
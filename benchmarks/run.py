@@ -0,0 +1,35 @@
+"""
+Runs all pyneng benchmarks and compares them with baselines.json.
+
+    python benchmarks/run.py
+    python benchmarks/run.py --update-baseline
+
+Returns a non-zero exit code if any benchmark is slower than its baseline
+by more than the tolerance of the benchmark module.
+"""
+
+import argparse
+import sys
+
+import hot_paths
+import import_time
+
+SUITES = {"import_time": import_time, "hot_paths": hot_paths}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pyneng benchmarks")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "suites", nargs="*", help=f"run only these suites: {', '.join(SUITES)}"
+    )
+    args = parser.parse_args()
+    for name in args.suites:
+        if name not in SUITES:
+            parser.error(f"unknown suite {name}")
+    ok = True
+    for name in args.suites or SUITES:
+        print(f"\n{name}")
+        ok &= SUITES[name].run(repeat=args.repeat, update_baseline=args.update_baseline)
+    sys.exit(0 if ok else 1)
@@ -1,6 +1,21 @@
+import os
+
 __version__ = "5.1.0"
 
 ANSWERS_URL = "https://github.com/natenka/pyneng-tasks-solutions"
+ANSWERS_LOCAL_REPO = ".pyneng-answers"
+# how long (in seconds) local copies of the answers and tasks repositories are
+# considered fresh and are used without fetching from GitHub
+CACHE_TTL = int(os.environ.get("PYNENG_CACHE_TTL", 3600))
+# shared store of the tasks and answers repositories (directory or HTTP URL,
+# see pyneng_cli.store), it is used before GitHub
+STORE = os.environ.get("PYNENG_STORE")
+# pyneng local data: cached test results etc.
+CACHE_DIR = os.environ.get(
+    "PYNENG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pyneng")
+)
+# SQLite history of the test runs for pyneng --stats (empty value disables it)
+HISTORY = os.environ.get("PYNENG_HISTORY", os.path.join(CACHE_DIR, "history.sqlite"))
 # needed for tasks/tests updates
 TASKS_URL = "https://github.com/natenka/pynenguk-tasks"
 TASKS_LOCAL_REPO = ".pynenguk-tasks"
@@ -63,3 +78,5 @@ DB_TASK_DIRS = [
     "task_25_5a",
     "task_25_6",
 ]
+# chapters whose tests parse and compile the same templates many times
+TEMPLATE_CHAPTERS = ["20_jinja2", "21_textfsm"]
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+
+from pyneng_cli import CACHE_DIR
+
+SYNC_STATE_DIR = "chapter_sync"
+NEW_DIR_SUFFIX = ".pyneng-new"
+OLD_DIR_SUFFIX = ".pyneng-old"
+
+
+class ChapterSyncState:
+    """
+    Upstream commit from which each chapter of the exercises directory was
+    last synced. It is stored in CACHE_DIR, not in the student's repository.
+    """
+
+    def __init__(self, exercises_path, cache_dir=CACHE_DIR):
+        exercises_path = os.path.abspath(exercises_path)
+        path_id = hashlib.sha256(exercises_path.encode("utf-8")).hexdigest()
+        self.filename = os.path.join(cache_dir, SYNC_STATE_DIR, f"{path_id[:16]}.json")
+        try:
+            with open(self.filename) as f:
+                self.commits = json.load(f)
+        except (OSError, ValueError):
+            self.commits = {}
+
+    def get(self, chapter):
+        return self.commits.get(chapter)
+
+    def set(self, chapter, commit):
+        self.commits[chapter] = commit
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        tmp_filename = f"{self.filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(self.commits, f)
+        os.replace(tmp_filename, self.filename)
+
+
+def link_or_copy(src, dst):
+    """
+    Hard link for files that are not changed (the file keeps its inode, so
+    editors and file watchers do not see a new file), copy if the file system
+    does not support hard links.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def recover_interrupted_sync(to_path):
+    """
+    If the previous update was interrupted between the two renames of
+    swap_dirs, the old version of the chapter is returned to its place.
+    """
+    old_path = to_path + OLD_DIR_SUFFIX
+    new_path = to_path + NEW_DIR_SUFFIX
+    if os.path.exists(old_path):
+        if os.path.exists(to_path):
+            shutil.rmtree(old_path)
+        else:
+            os.rename(old_path, to_path)
+    if os.path.exists(new_path):
+        shutil.rmtree(new_path)
+
+
+def swap_dirs(new_path, to_path):
+    """
+    Replaces to_path with new_path. Chapter is never left half-deleted: at any
+    moment there is either the old or the new version of the directory (or
+    the old one under OLD_DIR_SUFFIX name, see recover_interrupted_sync).
+    """
+    old_path = to_path + OLD_DIR_SUFFIX
+    if os.path.exists(to_path):
+        os.rename(to_path, old_path)
+    os.rename(new_path, to_path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+def build_incremental(from_path, to_path, new_path, changed):
+    """
+    Creates new_path from the current chapter (unchanged files are hard
+    linked) and copies only changed files from the tasks repository.
+    changed is a dict {path relative to the chapter: git status letter}.
+    """
+    for dirpath, _, filenames in os.walk(to_path):
+        rel_dir = os.path.relpath(dirpath, to_path)
+        os.makedirs(os.path.join(new_path, rel_dir), exist_ok=True)
+        for filename in filenames:
+            rel_file = os.path.normpath(os.path.join(rel_dir, filename))
+            if rel_file not in changed:
+                link_or_copy(
+                    os.path.join(dirpath, filename), os.path.join(new_path, rel_file)
+                )
+    for rel_file, status in changed.items():
+        if status == "D":
+            continue
+        dst = os.path.join(new_path, rel_file)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copy2(os.path.join(from_path, rel_file), dst)
+
+
+def sync_chapter(tasks_repo, source_pth, chapter, sync_state):
+    """
+    The function updates the chapter in source_pth (exercises directory) from
+    the tasks repository cache.
+
+    If the upstream commit of the previous sync is known, only the files that
+    changed upstream since that commit are copied, the other files of the
+    chapter are kept as is. Otherwise (first update of the chapter) the whole
+    chapter is copied. The new version is built next to the chapter and then
+    swapped with it. Returns the number of copied files.
+    """
+    to_path = os.path.join(source_pth, chapter)
+    new_path = to_path + NEW_DIR_SUFFIX
+    repo_chapter = f"exercises/{chapter}"
+    from_path = os.path.join(tasks_repo.path, repo_chapter)
+    recover_interrupted_sync(to_path)
+
+    head = tasks_repo.head()
+    last_commit = sync_state.get(chapter)
+    changed = None
+    if last_commit and os.path.exists(to_path):
+        if last_commit == head:
+            return 0
+        changed = tasks_repo.changed_files(last_commit, repo_chapter)
+
+    if changed is None:
+        shutil.copytree(from_path, new_path)
+        copied = sum(len(files) for _, _, files in os.walk(new_path))
+    else:
+        changed = {
+            os.path.normpath(os.path.relpath(f, repo_chapter)): status
+            for f, status in changed.items()
+        }
+        if not changed:
+            sync_state.set(chapter, head)
+            return 0
+        build_incremental(from_path, to_path, new_path, changed)
+        copied = len(changed)
+    swap_dirs(new_path, to_path)
+    sync_state.set(chapter, head)
+    return copied
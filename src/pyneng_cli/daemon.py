@@ -0,0 +1,285 @@
+"""
+Optional pyneng daemon that keeps click, pytest, rich and the libraries used
+in the tasks imported, and forks a new process for each pyneng call.
+
+pyneng --daemon starts the daemon (in the foreground). When the daemon is
+running, the pyneng command is a thin client: it sends the current
+directory, arguments and environment to the daemon together with its
+stdin/stdout/stderr file descriptors, so the output of the forked process
+goes directly to the client terminal. Without the daemon (or on platforms
+without Unix sockets) pyneng runs as usual in its own process.
+
+Only the standard library is imported at the module level, so the client
+starts fast. pyneng_cli modules read their settings (PYNENG_CACHE_DIR,
+PYNENG_HISTORY, PYNENG_STORE ...) from the environment when they are
+imported, so the forked process imports them again after it gets the
+environment of the client (the libraries stay imported).
+"""
+
+import hashlib
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+
+# pyneng_cli modules are imported to preload the libraries they use, they are
+# imported again in each forked process (see _unload_pyneng_cli). pytest
+# plugins (pytest_clarity) are not preloaded: pytest can not rewrite the
+# asserts of a module that is already imported and warns about it
+PRELOAD_MODULES = [
+    "click",
+    "pytest",
+    "rich.console",
+    "rich.markdown",
+    "jinja2",
+    "textfsm",
+    "pyneng_cli.pyneng",
+    "pyneng_cli.pytest_plugin",
+]
+
+
+def socket_dir():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"pyneng-{os.getuid()}")
+
+
+def socket_path():
+    """
+    Path of the daemon socket. A daemon runs only the calls of pyneng from
+    the same Python environment (interpreter and virtual environment).
+    """
+    executable = os.path.realpath(sys.executable)
+    environment = f"{executable}\0{sys.prefix}".encode("utf-8")
+    name = hashlib.sha256(environment).hexdigest()[:16]
+    return os.path.join(socket_dir(), f"{name}.sock")
+
+
+def private_dir(path, create=False):
+    """
+    The function checks that the directory belongs to the current user and
+    other users have no access to it (the temporary directory is shared, so
+    another user could create the socket first). If create is True, the
+    directory is created if it does not exist.
+    """
+    if create:
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+    try:
+        dir_stat = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(dir_stat.st_mode)
+        and dir_stat.st_uid == os.getuid()
+        and not dir_stat.st_mode & 0o077
+    )
+
+
+def daemon_supported():
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
+
+def _read_line(conn):
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(4096)
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def run_in_daemon(args):
+    """
+    The function sends the pyneng call to the daemon and waits for the exit
+    code. Returns None if the daemon is not running.
+    """
+    import signal
+
+    if not private_dir(socket_dir()):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path())
+    except OSError:
+        conn.close()
+        return None
+    # the environment and the terminal are sent only to a daemon of this user
+    if _peer_uid(conn) != os.getuid():
+        conn.close()
+        return None
+    request = {"cwd": os.getcwd(), "args": args, "env": dict(os.environ)}
+    payload = json.dumps(request).encode("utf-8") + b"\n"
+    socket.send_fds(conn, [payload], [0, 1, 2])
+    with conn:
+        response = _read_line(conn)
+        if response is None:
+            return 1
+        child_pid = int(response)
+        while True:
+            try:
+                response = _read_line(conn)
+                return 1 if response is None else int(response)
+            except KeyboardInterrupt:
+                # Ctrl-C is sent only to the client, pass it to the forked process
+                os.kill(child_pid, signal.SIGINT)
+
+
+def main():
+    """
+    Entry point of the pyneng command.
+    """
+    args = sys.argv[1:]
+    if daemon_supported() and "--daemon" not in args:
+        exit_code = run_in_daemon(args)
+        if exit_code is not None:
+            sys.exit(exit_code)
+    from pyneng_cli import timings
+
+    imports_start = timings.now_us()
+    from pyneng_cli.pyneng import cli
+
+    timings.record_imports(imports_start, timings.now_us())
+    cli()
+
+
+def _peer_uid(conn):
+    if not hasattr(socket, "SO_PEERCRED"):
+        return os.getuid()
+    creds = conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+def _unload_pyneng_cli():
+    """
+    Removes pyneng_cli modules from sys.modules, so that the next import
+    reads the settings from the current environment.
+    """
+    for name in list(sys.modules):
+        if name == "pyneng_cli" or name.startswith("pyneng_cli."):
+            del sys.modules[name]
+
+
+def _handle_request(conn, server):
+    """
+    Runs pyneng in the forked process with the file descriptors, current
+    directory and environment of the client.
+    """
+    import signal
+
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server.close()
+    exit_code = 1
+    try:
+        data, fds, _, _ = socket.recv_fds(conn, 1024 * 1024, 3)
+        while not data.endswith(b"\n"):
+            chunk = conn.recv(1024 * 1024)
+            if not chunk:
+                os._exit(1)
+            data += chunk
+        request = json.loads(data)
+        for target_fd, client_fd in enumerate(fds):
+            os.dup2(client_fd, target_fd)
+            os.close(client_fd)
+        # the buffering of the std streams depends on the client terminal
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", buffering=1, closefd=False)
+        sys.stderr = open(2, "w", buffering=1, closefd=False)
+        os.environ.clear()
+        os.environ.update(request["env"])
+        os.chdir(request["cwd"])
+        conn.sendall(f"{os.getpid()}\n".encode())
+
+        _unload_pyneng_cli()
+        from pyneng_cli.pyneng import cli
+
+        try:
+            cli.main(args=request["args"], prog_name="pyneng")
+            exit_code = 0
+        except SystemExit as error:
+            if error.code is None:
+                exit_code = 0
+            elif isinstance(error.code, int):
+                exit_code = error.code
+        except Exception:
+            sys.excepthook(*sys.exc_info())
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            conn.sendall(f"{exit_code}\n".encode())
+        except OSError:
+            pass
+        os._exit(exit_code)
+
+
+def serve():
+    """
+    Starts the daemon: imports the heavy modules once and forks a process
+    for each client request.
+    """
+    import importlib
+    import signal
+
+    path = socket_path()
+    if not private_dir(socket_dir(), create=True):
+        print(
+            f"pyneng daemon is not started: {socket_dir()} must be a directory "
+            "of the current user without access for other users"
+        )
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        if os.path.exists(path):
+            # socket of a daemon that was not stopped correctly
+            os.unlink(path)
+    else:
+        probe.close()
+        print(f"pyneng daemon is already running ({path})")
+        return
+    finally:
+        probe.close()
+
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    # forked processes are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # kill/systemd stop the daemon with SIGTERM, the socket must be removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    print(f"pyneng daemon is listening on {path}. Press Ctrl-C to stop")
+    try:
+        while True:
+            conn, _ = server.accept()
+            if _peer_uid(conn) != os.getuid():
+                conn.close()
+                continue
+            if os.fork() == 0:
+                _handle_request(conn, server)
+            conn.close()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        server.close()
+        os.unlink(path)
@@ -0,0 +1,475 @@
+"""
+Simulator of Cisco IOS-like devices for the tests of 18_ssh_telnet and
+19_concurrent_connections chapters.
+
+All devices are served by one asyncio event loop in a background thread, each
+device listens on its own localhost port, so hundreds of concurrent sessions
+are cheap. Devices support login, enable mode, configuration mode, canned
+show outputs and per-command latency.
+
+Telnet uses only the standard library. SSH is available if asyncssh is
+installed (pip install pyneng-cli[simulator]).
+
+In tests the devices are available with the fixtures of pyneng pytest plugin
+(pyneng_devices, pyneng_simulator). The simulator can also be started
+manually for experiments:
+
+    python -m pyneng_cli.device_simulator --devices 5 --latency 0.5
+"""
+
+import asyncio
+import threading
+
+DEFAULT_USERNAME = "cisco"
+DEFAULT_PASSWORD = "cisco"
+DEFAULT_SECRET = "cisco"
+TELNET_IAC = 255
+
+SHOW_VERSION = """Cisco IOS Software, 7200 Software (C7200-ADVENTERPRISEK9-M), Version 15.2(4)S7, RELEASE SOFTWARE (fc4)
+Technical Support: http://www.cisco.com/techsupport
+Copyright (c) 1986-2015 by Cisco Systems, Inc.
+
+ROM: ROMMON Emulation Microcode
+BOOTLDR: 7200 Software (C7200-ADVENTERPRISEK9-M), Version 15.2(4)S7, RELEASE SOFTWARE (fc4)
+
+{hostname} uptime is 1 hour, 5 minutes
+System returned to ROM by unknown reload cause - suspect boot_data[BOOT_COUNT] 0x0, BOOT_COUNT 0, BOOTDATA 19
+System image file is "tftp://255.255.255.255/unknown"
+
+Cisco 7206VXR (NPE400) processor (revision A) with 491520K/32768K bytes of memory.
+4 FastEthernet interfaces
+
+Configuration register is 0x2102
+"""
+
+SHOW_IP_INT_BR = """Interface                  IP-Address      OK? Method Status                Protocol
+Ethernet0/0                {ip}      YES NVRAM  up                    up
+Ethernet0/1                unassigned      YES NVRAM  administratively down down
+Ethernet0/2                unassigned      YES NVRAM  administratively down down
+Ethernet0/3                unassigned      YES NVRAM  administratively down down
+"""
+
+SHOW_RUN = """Building configuration...
+
+Current configuration : 1024 bytes
+!
+version 15.2
+service timestamps debug datetime msec
+service timestamps log datetime msec
+no service password-encryption
+!
+hostname {hostname}
+!
+interface Ethernet0/0
+ ip address {ip} 255.255.255.0
+!
+interface Ethernet0/1
+ no ip address
+ shutdown
+!
+line vty 0 4
+ login local
+ transport input telnet ssh
+!
+end
+"""
+
+SHOW_CLOCK = "*12:00:00.000 UTC Mon Jan 1 2024\n"
+
+INVALID_INPUT = "% Invalid input detected at '^' marker.\n"
+
+CONFIG_SUBMODES = {
+    "interface": "config-if",
+    "router": "config-router",
+    "line": "config-line",
+    "ip access-list": "config-ext-nacl",
+}
+
+
+class SimulatedDevice:
+    """
+    Settings and state of one simulated device. outputs is a dict
+    {command: output} (the output can contain {hostname} and {ip}),
+    latency is a delay in seconds for each command, command_latency is a
+    dict {command: delay} for separate commands.
+    """
+
+    def __init__(
+        self,
+        hostname,
+        ip,
+        username=DEFAULT_USERNAME,
+        password=DEFAULT_PASSWORD,
+        secret=DEFAULT_SECRET,
+        outputs=None,
+        latency=0.0,
+        command_latency=None,
+    ):
+        self.hostname = hostname
+        self.ip = ip
+        self.username = username
+        self.password = password
+        self.secret = secret
+        self.outputs = {
+            "show version": SHOW_VERSION,
+            "show ip interface brief": SHOW_IP_INT_BR,
+            "show running-config": SHOW_RUN,
+            "show clock": SHOW_CLOCK,
+            "terminal length 0": "",
+            "terminal width 511": "",
+        }
+        self.outputs.update(outputs or {})
+        self.latency = latency
+        self.command_latency = command_latency or {}
+        self.host = None
+        self.telnet_port = None
+        self.ssh_port = None
+
+    def netmiko_params(self, protocol="ssh"):
+        """
+        Parameters for netmiko ConnectHandler.
+        """
+        port = self.ssh_port if protocol == "ssh" else self.telnet_port
+        return {
+            "device_type": "cisco_ios" if protocol == "ssh" else "cisco_ios_telnet",
+            "host": self.host,
+            "port": port,
+            "username": self.username,
+            "password": self.password,
+            "secret": self.secret,
+        }
+
+
+def match_command(line, commands):
+    """
+    Finds the command for an abbreviated line (sh ip int br -> show ip
+    interface brief). Returns None if there is no such command.
+    """
+    words = line.split()
+    for command in commands:
+        command_words = command.split()
+        if len(words) == len(command_words) and all(
+            command_word.startswith(word)
+            for word, command_word in zip(words, command_words)
+        ):
+            return command
+    return None
+
+
+class CliSession:
+    """
+    Command line of one session: prompts, enable and configuration modes.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.enabled = False
+        self.config_modes = []
+
+    @property
+    def prompt(self):
+        if self.config_modes:
+            return f"{self.device.hostname}({self.config_modes[-1]})#"
+        return f"{self.device.hostname}{'#' if self.enabled else '>'}"
+
+    def output(self, line):
+        """
+        Returns (output, exit) for the line. exit is True if the session must
+        be closed.
+        """
+        line = line.strip()
+        if not line:
+            return "", False
+        command = match_command(line, ["exit", "logout", "end", "disable"])
+        if self.config_modes:
+            if command == "end":
+                self.config_modes = []
+            elif command == "exit":
+                self.config_modes.pop()
+            elif line.startswith("do "):
+                return self.show(line[3:]), False
+            else:
+                for prefix, mode in CONFIG_SUBMODES.items():
+                    words = line.split()[: len(prefix.split())]
+                    if match_command(" ".join(words), [prefix]):
+                        if len(self.config_modes) == 1:
+                            self.config_modes.append(mode)
+                        else:
+                            self.config_modes[-1] = mode
+                        break
+            return "", False
+        if command in ("exit", "logout"):
+            return "", True
+        if command == "disable":
+            self.enabled = False
+            return "", False
+        if self.enabled and match_command(line, ["configure terminal"]):
+            self.config_modes = ["config"]
+            return (
+                "Enter configuration commands, one per line.  End with CNTL/Z.\n",
+                False,
+            )
+        return self.show(line), False
+
+    def show(self, line):
+        device = self.device
+        command = match_command(line, device.outputs)
+        if command is None:
+            return INVALID_INPUT
+        if command == "show running-config" and not self.enabled:
+            return INVALID_INPUT
+        return device.outputs[command].format(hostname=device.hostname, ip=device.ip)
+
+    def latency(self, line):
+        command = match_command(line.strip(), self.device.command_latency)
+        if command:
+            return self.device.command_latency[command]
+        return self.device.latency
+
+
+class LineReader:
+    """
+    Reads lines from a stream that sends chars without line editing (telnet,
+    SSH without line editor). Lines can end with \\r, \\n, \\r\\n or \\r\\0,
+    telnet commands (IAC) are skipped.
+    """
+
+    def __init__(self, read):
+        self.read = read
+        self.buffer = ""
+
+    async def readline(self):
+        while True:
+            for position, char in enumerate(self.buffer):
+                if char in "\r\n":
+                    line = self.buffer[:position]
+                    rest = self.buffer[position + 1 :]
+                    if char == "\r" and rest[:1] in ("\n", "\0"):
+                        rest = rest[1:]
+                    self.buffer = rest
+                    return line
+            data = await self.read(1024)
+            if not data:
+                return None
+            self.buffer += data
+
+
+def strip_telnet_commands(data):
+    """
+    Removes telnet option negotiation (IAC sequences) from the data.
+    """
+    result = bytearray()
+    position = 0
+    while position < len(data):
+        byte = data[position]
+        if byte == TELNET_IAC and position + 1 < len(data):
+            command = data[position + 1]
+            # WILL, WONT, DO, DONT have an option byte
+            position += 3 if 251 <= command <= 254 else 2
+            continue
+        result.append(byte)
+        position += 1
+    return bytes(result)
+
+
+async def run_cli(device, reader, write, login=True):
+    """
+    Runs the device command line for one session. write is a function that
+    sends a string to the client. If login is True, the username and
+    password are requested (telnet), with SSH they are checked by the
+    server.
+    """
+    if login:
+        write("\r\nUser Access Verification\r\n\r\nUsername: ")
+        username = await reader.readline()
+        write("\r\nPassword: ")
+        password = await reader.readline()
+        if (username, password) != (device.username, device.password):
+            write("\r\n% Login invalid\r\n")
+            return
+    session = CliSession(device)
+    write(f"\r\n{session.prompt}")
+    while True:
+        line = await reader.readline()
+        if line is None:
+            return
+        # the command is echoed as by a real terminal
+        write(line + "\r\n")
+        if not session.enabled and match_command(line.strip(), ["enable"]):
+            write("Password: ")
+            secret = await reader.readline()
+            if secret == device.secret:
+                session.enabled = True
+            else:
+                write("\r\n% Access denied\r\n")
+            write(f"\r\n{session.prompt}")
+            continue
+        delay = session.latency(line)
+        if delay:
+            await asyncio.sleep(delay)
+        output, close = session.output(line)
+        if close:
+            return
+        if output:
+            write(output.replace("\n", "\r\n"))
+        write(session.prompt)
+
+
+class DeviceSimulator:
+    """
+    Starts count devices (R1, R2, ...) on host. Each device listens for
+    telnet and (if asyncssh is installed) SSH on ports chosen by the OS.
+
+        with DeviceSimulator(count=100, latency=0.5) as simulator:
+            for device in simulator.devices:
+                print(device.netmiko_params())
+    """
+
+    def __init__(self, count=10, host="127.0.0.1", ssh=None, **device_settings):
+        self.count = count
+        self.host = host
+        self.device_settings = device_settings
+        if ssh is None:
+            ssh = ssh_supported()
+        self.ssh = ssh
+        self.devices = []
+        self.loop = None
+        self._thread = None
+        self._servers = []
+        self._sessions = set()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        future = asyncio.run_coroutine_threadsafe(self._start(), self.loop)
+        future.result()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._stop(), self.loop)
+        future.result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self.loop = None
+
+    async def _start(self):
+        host_key = None
+        if self.ssh:
+            import asyncssh
+
+            host_key = asyncssh.generate_private_key("ssh-ed25519")
+        for number in range(1, self.count + 1):
+            device = SimulatedDevice(
+                f"R{number}",
+                f"10.{number // 256}.{number % 256}.1",
+                **self.device_settings,
+            )
+            device.host = self.host
+            server = await asyncio.start_server(
+                lambda r, w, device=device: self._telnet_session(device, r, w),
+                self.host,
+                0,
+            )
+            device.telnet_port = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+            if self.ssh:
+                server = await self._start_ssh(device, host_key)
+                device.ssh_port = server.sockets[0].getsockname()[1]
+                self._servers.append(server)
+            self.devices.append(device)
+
+    async def _start_ssh(self, device, host_key):
+        import asyncssh
+
+        class DeviceSSHServer(asyncssh.SSHServer):
+            def begin_auth(self, username):
+                return True
+
+            def password_auth_supported(self):
+                return True
+
+            def validate_password(self, username, password):
+                return (username, password) == (device.username, device.password)
+
+        async def process_factory(process):
+            reader = LineReader(process.stdin.read)
+            await self._session(run_cli(device, reader, process.stdout.write, False))
+            process.exit(0)
+
+        return await asyncssh.create_server(
+            DeviceSSHServer,
+            self.host,
+            0,
+            server_host_keys=[host_key],
+            process_factory=process_factory,
+            line_editor=False,
+        )
+
+    async def _telnet_session(self, device, stream_reader, writer):
+        async def read(size):
+            data = await stream_reader.read(size)
+            return strip_telnet_commands(data).decode("utf-8", errors="replace")
+
+        def write(text):
+            writer.write(text.encode("utf-8"))
+
+        try:
+            await self._session(run_cli(device, LineReader(read), write))
+        except (ConnectionError, asyncio.CancelledError):
+            # the session is cancelled when the simulator is stopped
+            pass
+        finally:
+            writer.close()
+
+    async def _session(self, coroutine):
+        task = asyncio.current_task()
+        self._sessions.add(task)
+        try:
+            await coroutine
+        finally:
+            self._sessions.discard(task)
+
+    async def _stop(self):
+        for server in self._servers:
+            server.close()
+        for task in list(self._sessions):
+            task.cancel()
+        await asyncio.gather(*self._sessions, return_exceptions=True)
+        self._servers = []
+
+
+def ssh_supported():
+    try:
+        import asyncssh  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="pyneng device simulator")
+    parser.add_argument("--devices", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    simulator = DeviceSimulator(count=args.devices, latency=args.latency)
+    simulator.start()
+    for sim_device in simulator.devices:
+        ssh = f", ssh port {sim_device.ssh_port}" if sim_device.ssh_port else ""
+        print(f"{sim_device.hostname}: telnet port {sim_device.telnet_port}{ssh}")
+    print("Press Ctrl-C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        simulator.stop()
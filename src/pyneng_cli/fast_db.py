@@ -0,0 +1,64 @@
+"""
+Fast mode of the tests of 25_db task directories (pyneng --fast-db).
+
+The tests of these tasks create, fill and query SQLite files in the task
+directory, and on network home directories each commit waits for fsync. In
+fast mode the pytest plugin registers FastDB, which before the tests:
+
+* copies the task directory to a new directory on tmpfs (FAST_DB_ROOT) and
+  makes it the current directory, so the database files created with
+  relative paths (and os.path.exists checks of the tasks) are in memory
+* sets PRAGMA synchronous=OFF and journal_mode=MEMORY for every
+  sqlite3.connect
+
+The task modules are still imported from the task directory. Each pytest run
+(each -j or sandbox worker) gets its own directory, so the workers do not use
+the same database files. After the tests the current directory is restored
+and the copy is removed, the task directory is not changed by the tests.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+# /dev/shm is tmpfs on Linux, elsewhere the temporary directory is used
+FAST_DB_ROOT = "/dev/shm" if os.access("/dev/shm", os.W_OK) else None
+IGNORE_FILES = shutil.ignore_patterns("__pycache__", ".pytest_cache")
+
+_sqlite_connect = sqlite3.connect
+
+
+def connect(*args, **kwargs):
+    """
+    sqlite3.connect with relaxed journaling (the database is in a temporary
+    directory, so there is nothing to protect from power loss).
+    """
+    connection = _sqlite_connect(*args, **kwargs)
+    try:
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("PRAGMA journal_mode = MEMORY")
+    except sqlite3.DatabaseError:
+        # for example, the database is locked by another connection
+        pass
+    return connection
+
+
+class FastDB:
+    def __init__(self, root=FAST_DB_ROOT):
+        self.root = root
+
+    def pytest_sessionstart(self, session):
+        self.task_dir = os.getcwd()
+        self.run_dir = tempfile.mkdtemp(prefix="pyneng-db-", dir=self.root)
+        # the same directory name, because the chapter name for the results
+        # is taken from the current directory
+        work_dir = os.path.join(self.run_dir, os.path.basename(self.task_dir))
+        shutil.copytree(self.task_dir, work_dir, ignore=IGNORE_FILES)
+        os.chdir(work_dir)
+        sqlite3.connect = connect
+
+    def pytest_sessionfinish(self, session):
+        sqlite3.connect = _sqlite_connect
+        os.chdir(self.task_dir)
+        shutil.rmtree(self.run_dir, ignore_errors=True)
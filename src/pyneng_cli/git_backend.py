@@ -0,0 +1,146 @@
+import functools
+import os
+import re
+import shlex
+import subprocess
+import sys
+
+from pyneng_cli import timings
+
+
+def run_git(args, cwd=None, input=None, git_config=None):
+    """
+    The function runs git with a list of arguments (without shell) and returns
+    subprocess.CompletedProcess with stdout and stderr as bytes.
+    git_config is a dict of config options for this call (git -c key=value).
+    """
+    config_args = []
+    for key, value in (git_config or {}).items():
+        config_args += ["-c", f"{key}={value}"]
+    with timings.span(f"git {args[0]}", "subprocess", command=shlex.join(args)):
+        return subprocess.run(
+            ["git", *config_args, *args],
+            cwd=cwd,
+            input=input,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+
+# since this version core.fsmonitor=true starts the builtin daemon (in older
+# versions the value is the path of a hook command)
+FSMONITOR_GIT_VERSION = (2, 36)
+
+
+@functools.lru_cache(maxsize=None)
+def git_version():
+    """
+    The function returns the git version as a tuple (major, minor) or None
+    if it can not be determined.
+    """
+    try:
+        result = subprocess.run(
+            ["git", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    except OSError:
+        return None
+    match = re.search(r"(\d+)\.(\d+)", result.stdout.decode("utf-8", "replace"))
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def fsmonitor_available():
+    """
+    git builtin fsmonitor daemon keeps running in the repository after pyneng
+    exits, so it is used only if the user enables it with
+    PYNENG_GIT_FSMONITOR=1. The daemon is available only on Windows and macOS
+    with git 2.36 or newer. Without it git uses core.fsmonitor from the
+    user's git config, if any.
+    """
+    if os.environ.get("PYNENG_GIT_FSMONITOR") != "1":
+        return False
+    elif sys.platform not in ("win32", "darwin"):
+        return False
+    version = git_version()
+    return version is not None and version >= FSMONITOR_GIT_VERSION
+
+
+class GitBackend:
+    """
+    Git operations with the student's repository for one pyneng command.
+
+    All operations are limited to paths (the current chapter or the chapters
+    being updated) and the result of git status is cached until
+    invalidate is called, so the status is not recalculated between the steps
+    of the command that do not change files. git status uses untracked cache
+    and fsmonitor (configured by the user or enabled with
+    PYNENG_GIT_FSMONITOR=1, see fsmonitor_available) to avoid scanning large
+    untracked directories.
+    """
+
+    def __init__(self, paths=(".",), cwd=None):
+        self.paths = list(paths)
+        self.cwd = cwd
+        self.git_config = {"core.untrackedCache": "true"}
+        if fsmonitor_available():
+            self.git_config["core.fsmonitor"] = "true"
+        self._status = None
+
+    def git(self, *args, verbose=False):
+        """
+        Runs git command and returns (returncode, stdout). If verbose is True,
+        the command and its output are printed.
+        """
+        result = run_git(args, cwd=self.cwd, git_config=self.git_config)
+        stdout = result.stdout.decode("utf-8", errors="replace")
+        if verbose:
+            print("#" * 20, shlex.join(["git", *args]))
+            if stdout:
+                print(stdout)
+            if result.stderr:
+                print(result.stderr.decode("utf-8", errors="replace"))
+        return result.returncode, stdout
+
+    def _existing_paths(self):
+        base = self.cwd or "."
+        return [p for p in self.paths if os.path.exists(os.path.join(base, p))]
+
+    def status(self):
+        if self._status is None:
+            _, self._status = self.git("status", "--porcelain", "--", *self.paths)
+        return self._status
+
+    def invalidate(self):
+        """
+        Must be called after files in paths are changed.
+        """
+        self._status = None
+
+    def is_clean(self):
+        return not self.status()
+
+    def show_diff_stat(self):
+        self.git("diff", "--stat", "--", *self.paths, verbose=True)
+
+    def push(self, branch="main"):
+        command = ["push", "origin", branch]
+        if sys.platform == "win32":
+            # on Windows the output is not captured so that git can ask for
+            # credentials
+            print("#" * 20, shlex.join(["git", *command]))
+            with timings.span("git push", "subprocess"):
+                subprocess.run(["git", *command], cwd=self.cwd)
+        else:
+            self.git(*command, verbose=True)
+
+    def save_changes(
+        self, message="All changes saved", git_add_all=True, branch="main"
+    ):
+        if self.is_clean():
+            return
+        if git_add_all:
+            self.git("add", "--all", "--", *self._existing_paths(), verbose=True)
+        self.git("commit", "-m", message, verbose=True)
+        self.push(branch)
+        self.invalidate()
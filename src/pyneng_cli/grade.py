@@ -0,0 +1,160 @@
+import io
+import os
+from collections import defaultdict
+from contextlib import redirect_stdout, redirect_stderr
+
+from pyneng_cli import TASK_DIRS, DB_TASK_DIRS, history, task_report
+from pyneng_cli.runner import run_pytest_parallel, run_pytest_cached
+from pyneng_cli.results import get_passed_tasks
+from pyneng_cli.utils import red, green
+
+GRADE_PYTEST_ARGS = [
+    "--disable-warnings",
+    "--tb=no",
+    "-q",
+    "-p",
+    "no:cacheprovider",
+]
+
+
+def exercises_chapters(exercises_dir, chapters=None):
+    """
+    The function returns the chapter directories of the exercises directory
+    (task directories of 25_db chapter are returned instead of the chapter).
+    chapters limits the result to these chapter names.
+    """
+    chapter_dirs = []
+    for chapter in sorted(os.listdir(exercises_dir)):
+        if chapters is not None and chapter not in chapters:
+            continue
+        chapter_dir = os.path.join(exercises_dir, chapter)
+        if not os.path.isdir(chapter_dir):
+            continue
+        if chapter in TASK_DIRS:
+            chapter_dirs.append(chapter_dir)
+        for db_task_dir in sorted(os.listdir(chapter_dir)):
+            if db_task_dir in DB_TASK_DIRS:
+                chapter_dirs.append(os.path.join(chapter_dir, db_task_dir))
+    return chapter_dirs
+
+
+def find_chapters(roots):
+    """
+    The function finds all exercises/NN_chapter directories under the roots.
+    Returns a list of tuples (repository directory, chapter directory).
+    """
+    chapters = []
+    for root in roots:
+        for dirpath, dirnames, _ in os.walk(root):
+            if os.path.basename(dirpath) != "exercises":
+                # .git and similar directories are not checked
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+                continue
+            repo_dir = os.path.dirname(dirpath)
+            for chapter_dir in exercises_chapters(dirpath):
+                chapters.append((repo_dir, chapter_dir))
+            dirnames[:] = []
+    return chapters
+
+
+def _grade_chapter(chapter_job):
+    """
+    Runs the tests of one chapter in a pool process. Each process handles only
+    one chapter (maxtasksperchild=1), so the imported task modules and the
+    current directory of one chapter do not affect the others.
+    """
+    (
+        repo_dir,
+        chapter_dir,
+        test_files,
+        pytest_args,
+        sandbox,
+        use_cache,
+        report,
+    ) = chapter_job
+    os.chdir(chapter_dir)
+    # the report file is written by the main process
+    report_records = task_report.collect_records(repo_dir) if report else []
+    output = io.StringIO()
+    with redirect_stdout(output), redirect_stderr(output):
+        if use_cache:
+            results = run_pytest_cached(
+                test_files, GRADE_PYTEST_ARGS + pytest_args, 1, sandbox
+            )
+        else:
+            # with sandbox a hanging task is killed after the timeout instead
+            # of blocking the pool process
+            results = run_pytest_parallel(
+                test_files, GRADE_PYTEST_ARGS + pytest_args, 1, sandbox
+            )
+    passed_tasks = get_passed_tasks(results)
+    failed_tasks = []
+    for test_file in sorted(set(test_files) - set(passed_tasks)):
+        # timeout, resource-limit and crashed outcomes of the sandbox
+        status = results.get(test_file, {}).get("status")
+        failed_tasks.append(f"{test_file} ({status})" if status else test_file)
+    # the history is written by the main process
+    records = history.task_records(results) if history.enabled() else []
+    return (
+        repo_dir,
+        chapter_dir,
+        sorted(passed_tasks),
+        failed_tasks,
+        records,
+        report_records,
+    )
+
+
+def print_chapter_result(repo_dir, chapter_dir, passed_tasks, failed_tasks):
+    total = len(passed_tasks) + len(failed_tasks)
+    chapter = os.path.relpath(chapter_dir, repo_dir)
+    if repo_dir != os.curdir:
+        chapter = f"{repo_dir} {chapter}"
+    line = f"{chapter}: passed {len(passed_tasks)}/{total}"
+    if failed_tasks:
+        print(red(f"{line}, failed {', '.join(failed_tasks)}"))
+    else:
+        print(green(line))
+
+
+def grade_chapters(chapter_jobs, jobs, pytest_args=None, sandbox=None, use_cache=False):
+    """
+    The function runs the tests of the chapters in a pool of jobs processes
+    and prints the results for each chapter and the summary for each
+    repository. chapter_jobs is a list of tuples
+    (repository directory, chapter directory, test files).
+    pytest_args are added to GRADE_PYTEST_ARGS. sandbox (SandboxLimits)
+    runs each test file of the chapters in a sandbox worker. If use_cache
+    is True, passed unchanged tasks are not tested again (see ResultCache).
+
+    Returns a dict {repository: {chapter directory: (passed, failed)}}.
+    """
+    results = defaultdict(dict)
+    pytest_args = pytest_args or []
+    report = task_report.enabled()
+    chapter_jobs = [
+        (repo_dir, chapter_dir, test_files, pytest_args, sandbox, use_cache, report)
+        for repo_dir, chapter_dir, test_files in chapter_jobs
+        if test_files
+    ]
+    if not chapter_jobs:
+        return results
+    import multiprocessing
+
+    with multiprocessing.Pool(processes=jobs, maxtasksperchild=1) as pool:
+        for chapter_result in pool.imap(_grade_chapter, chapter_jobs):
+            repo_dir, chapter_dir, passed, failed, records, report_records = (
+                chapter_result
+            )
+            print_chapter_result(repo_dir, chapter_dir, passed, failed)
+            history.add_records(records)
+            task_report.write_records(report_records)
+            results[repo_dir][chapter_dir] = passed, failed
+
+    print("\nSummary:")
+    for repo_dir, chapters in results.items():
+        passed = sum(len(p) for p, _ in chapters.values())
+        total = sum(len(p) + len(f) for p, f in chapters.values())
+        name = repo_dir if repo_dir != os.curdir else "Total"
+        print(f"{name}: passed {passed}/{total} tasks in {len(chapters)} chapters")
+    return results
@@ -0,0 +1,340 @@
+"""
+Local history of pyneng test runs and pyneng --stats.
+
+For each tested task the history keeps the outcome, duration, hash of the
+task file and its test file, the time of the run and the outcome and
+duration of each test.
+The records of a run are collected in memory (add_results) and written to
+the SQLite database HISTORY in one transaction at the end of the run (save),
+so the history does not slow down the tests. Cached results (tasks that were
+not tested again) are not added.
+
+Tables:
+
+* chapters - path of each chapter directory (repositories of different
+  students have different paths)
+* task_runs - one row per tested task, indexes (chapter_id, task, time),
+  (chapter_id, task, task_hash) for the runs of a task file version and
+  a partial index of the runs that did not pass by time (regressions are
+  searched only among them, from the latest)
+* test_runs - tests of the task run, clustered by (task_run_id, test) with
+  a partial index of the tests that did not pass (flaky tests are searched
+  only among them)
+
+pyneng --stats prints the statistics of the chapters in the current
+directory and its subdirectories: slowest tasks, regressions, flaky tests
+and time to green.
+"""
+
+import hashlib
+import os
+import time
+
+from pyneng_cli import HISTORY
+from pyneng_cli.result_cache import file_hash
+from pyneng_cli.task_report import task_id, task_outcome
+from pyneng_cli.utils import red, green
+
+# length of the task file hash in the history
+HASH_LENGTH = 16
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chapters (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS task_runs (
+    id INTEGER PRIMARY KEY,
+    chapter_id INTEGER NOT NULL REFERENCES chapters (id),
+    task TEXT NOT NULL,
+    time REAL NOT NULL,
+    task_hash TEXT,
+    outcome TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS task_runs_task ON task_runs (chapter_id, task, time);
+CREATE INDEX IF NOT EXISTS task_runs_version
+    ON task_runs (chapter_id, task, task_hash);
+CREATE INDEX IF NOT EXISTS task_runs_not_passed ON task_runs (time)
+    WHERE outcome != 'passed';
+CREATE TABLE IF NOT EXISTS test_runs (
+    task_run_id INTEGER NOT NULL REFERENCES task_runs (id),
+    test TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    duration REAL NOT NULL,
+    PRIMARY KEY (task_run_id, test)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS test_runs_not_passed ON test_runs (task_run_id)
+    WHERE outcome != 'passed';
+"""
+_records = []
+
+
+def enabled():
+    return bool(HISTORY)
+
+
+def task_file_hash(chapter_path, test_file):
+    """
+    Hash of the task file and the test file, so the changes of the other
+    files of the chapter do not make a new version of the task. Returns None
+    if there is no task file.
+    """
+    task_file = test_file.replace("test_", "", 1)
+    task_hash = file_hash(os.path.join(chapter_path, task_file))
+    if task_hash is None:
+        return None
+    test_hash = file_hash(os.path.join(chapter_path, test_file))
+    return hashlib.sha256(f"{task_hash}{test_hash}".encode("utf-8")).hexdigest()
+
+
+def task_records(results, chapter_dir=os.curdir):
+    """
+    Converts the results of the tests of chapter_dir (see ResultsCollector)
+    to the history records: tuples (chapter path, task, time, task hash,
+    outcome, duration, tests). tests is a list of tuples (test, outcome,
+    duration).
+    """
+    records = []
+    chapter_path = os.path.abspath(chapter_dir)
+    now = time.time()
+    for test_file, file_result in (results or {}).items():
+        if file_result.get("cached"):
+            continue
+        version = task_file_hash(chapter_path, os.path.basename(test_file))
+        tests = [
+            (test, outcome, round(duration, 6))
+            for test, (outcome, duration) in file_result.get("tests", {}).items()
+        ]
+        records.append(
+            (
+                chapter_path,
+                task_id(test_file),
+                now,
+                version[:HASH_LENGTH] if version else None,
+                task_outcome(file_result),
+                round(file_result["duration"], 6),
+                tests,
+            )
+        )
+    return records
+
+
+def add_results(results, chapter_dir=os.curdir):
+    if enabled():
+        _records.extend(task_records(results, chapter_dir))
+
+
+def add_records(records):
+    if enabled():
+        _records.extend(records)
+
+
+def connect(filename=HISTORY):
+    import sqlite3
+
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # several pyneng processes can write to the history of a shared grading
+    # environment at the same time
+    connection = sqlite3.connect(filename, timeout=30)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def write_records(connection, records):
+    """
+    Writes the records in one transaction.
+    """
+    chapter_ids = {}
+    with connection:
+        for path in {record[0] for record in records}:
+            connection.execute(
+                "INSERT OR IGNORE INTO chapters (path) VALUES (?)", (path,)
+            )
+            chapter_ids[path] = connection.execute(
+                "SELECT id FROM chapters WHERE path = ?", (path,)
+            ).fetchone()[0]
+        for path, task, run_time, task_hash, outcome, duration, tests in records:
+            cursor = connection.execute(
+                "INSERT INTO task_runs "
+                "(chapter_id, task, time, task_hash, outcome, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chapter_ids[path], task, run_time, task_hash, outcome, duration),
+            )
+            connection.executemany(
+                "INSERT INTO test_runs (task_run_id, test, outcome, duration) "
+                "VALUES (?, ?, ?, ?)",
+                [(cursor.lastrowid, *test) for test in tests],
+            )
+
+
+def save(filename=HISTORY):
+    """
+    Writes the records of this run to the history. Errors (for example, the
+    database is locked for too long) do not fail the run.
+    """
+    global _records
+    if not enabled() or not _records:
+        return
+    import sqlite3
+
+    records, _records = _records, []
+    try:
+        connection = connect(filename)
+        try:
+            write_records(connection, records)
+        finally:
+            connection.close()
+    except (OSError, sqlite3.Error) as error:
+        print(red(f"The run history is not saved to {filename}: {error}"))
+
+
+# chapters in the directory (the path itself or paths that start with
+# path + separator, which is an index range of chapters.path)
+SCOPE = """
+WITH scope AS (
+    SELECT id, path FROM chapters
+    WHERE path = :path OR (path > :prefix AND path < :prefix_end)
+)
+"""
+
+STATS_QUERIES = {
+    "slowest": SCOPE
+    + """
+SELECT scope.path, t.task, count(*), avg(t.duration), max(t.duration)
+FROM scope JOIN task_runs AS t ON t.chapter_id = scope.id
+GROUP BY t.chapter_id, t.task
+ORDER BY avg(t.duration) DESC
+LIMIT :limit
+""",
+    # runs that did not pass after a passed run of the task, from the latest
+    "regressions": SCOPE
+    + """
+SELECT chapters.path, t.task, t.time, t.outcome, t.task_hash = p.task_hash
+FROM task_runs AS t INDEXED BY task_runs_not_passed
+JOIN task_runs AS p ON p.id = (
+    SELECT id FROM task_runs
+    WHERE chapter_id = t.chapter_id AND task = t.task AND time < t.time
+    ORDER BY time DESC
+    LIMIT 1
+)
+JOIN chapters ON chapters.id = t.chapter_id
+WHERE t.outcome != 'passed' AND p.outcome = 'passed'
+      AND t.chapter_id IN (SELECT id FROM scope)
+ORDER BY t.time DESC
+LIMIT :limit
+""",
+    # tests that did not pass in a run of the task file version and passed
+    # in another run of the same version. The runs that did not pass are
+    # counted by the partial index, only the runs of these versions are
+    # looked up
+    "flaky": SCOPE
+    + """
+, not_passed AS (
+    SELECT t.chapter_id, t.task, t.task_hash, r.test, count(*) AS not_passed
+    FROM task_runs AS t
+    JOIN test_runs AS r INDEXED BY test_runs_not_passed ON r.task_run_id = t.id
+    WHERE r.outcome != 'passed' AND t.task_hash IS NOT NULL
+          AND t.chapter_id IN (SELECT id FROM scope)
+    GROUP BY t.chapter_id, t.task, t.task_hash, r.test
+), flaky AS (
+    SELECT n.chapter_id, n.task, n.test, n.not_passed,
+           (SELECT count(*) FROM task_runs AS t
+            JOIN test_runs AS r ON r.task_run_id = t.id AND r.test = n.test
+            WHERE t.chapter_id = n.chapter_id AND t.task = n.task
+                  AND t.task_hash = n.task_hash) AS runs
+    FROM not_passed AS n
+)
+SELECT chapters.path, f.task, f.test, f.runs, f.runs - f.not_passed
+FROM flaky AS f JOIN chapters ON chapters.id = f.chapter_id
+WHERE f.runs > f.not_passed
+ORDER BY f.runs DESC
+LIMIT :limit
+""",
+    "time_to_green": SCOPE
+    + """
+, green AS (
+    SELECT chapter_id, task, min(time) AS first_run,
+           min(CASE WHEN outcome = 'passed' THEN time END) AS green_run
+    FROM task_runs
+    WHERE chapter_id IN (SELECT id FROM scope)
+    GROUP BY chapter_id, task
+)
+SELECT chapters.path, green.task, green.green_run - green.first_run,
+       (SELECT count(*) FROM task_runs AS t
+        WHERE t.chapter_id = green.chapter_id AND t.task = green.task
+              AND t.time <= green.green_run)
+FROM green JOIN chapters ON chapters.id = green.chapter_id
+WHERE green.green_run IS NOT NULL
+ORDER BY green.green_run - green.first_run DESC
+LIMIT :limit
+""",
+}
+
+
+def query_stats(connection, path=None, limit=10):
+    """
+    Returns a dict {query name: rows} for the chapters in path.
+    """
+    path = os.path.abspath(path or os.curdir)
+    prefix = path.rstrip(os.sep) + os.sep
+    params = {
+        "path": path,
+        "prefix": prefix,
+        "prefix_end": prefix[:-1] + chr(ord(os.sep) + 1),
+        "limit": limit,
+    }
+    return {
+        name: connection.execute(query, params).fetchall()
+        for name, query in STATS_QUERIES.items()
+    }
+
+
+def _duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.2f}s"
+    elif seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    elif seconds < 86400:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds / 86400:.1f}d"
+
+
+def _chapter(path):
+    relative = os.path.relpath(path)
+    if relative == os.curdir:
+        return os.path.basename(path)
+    return relative if not relative.startswith("..") else path
+
+
+def print_stats(filename=HISTORY, path=None, limit=10):
+    if not enabled():
+        print(red("The run history is disabled (PYNENG_HISTORY is empty)"))
+        return
+    elif not os.path.exists(filename):
+        print(red("The run history is empty: no tests have been run yet"))
+        return
+    connection = connect(filename)
+    try:
+        stats = query_stats(connection, path, limit)
+    finally:
+        connection.close()
+
+    print(green("Slowest tasks (average duration of a run):"))
+    for path, task, runs, average, maximum in stats["slowest"]:
+        print(
+            f"  {_chapter(path)} {task}: {_duration(average)} "
+            f"(max {_duration(maximum)}, {runs} runs)"
+        )
+    print(green("\nRegressions (failed after a passed run):"))
+    for path, task, run_time, outcome, same_hash in stats["regressions"]:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(run_time))
+        changed = "task unchanged" if same_hash else "task changed"
+        print(f"  {_chapter(path)} {task}: {outcome} at {when} ({changed})")
+    print(green("\nFlaky tests (different outcomes of the same task file):"))
+    for path, task, test, runs, passed in stats["flaky"]:
+        print(f"  {_chapter(path)} {task} {test}: passed {passed}/{runs} runs")
+    print(green("\nTime to green (from the first run to the first passed run):"))
+    for path, task, seconds, runs in stats["time_to_green"]:
+        print(f"  {_chapter(path)} {task}: {_duration(seconds)}, passed on run {runs}")
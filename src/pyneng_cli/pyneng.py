@@ -2,13 +2,8 @@ import sys
 import re
 import os
 import json
-from glob import glob
 
 import click
-import pytest
-from rich.console import Console
-from rich.markdown import Markdown
-from pytest_jsonreport.plugin import JSONReport
 
 from pyneng_cli import (
     DEFAULT_BRANCH,
@@ -16,20 +11,28 @@ from pyneng_cli import (
     DB_TASK_DIRS,
     TASK_NUMBER_DIR_MAP,
 )
+from pyneng_cli import history, task_report, timings
 from pyneng_cli.exceptions import PynengError
 from pyneng_cli.pyneng_docs import DOCS
+from pyneng_cli.runner import run_pytest_parallel, run_pytest_cached
+from pyneng_cli.grade import find_chapters, exercises_chapters, grade_chapters
+from pyneng_cli.results import get_passed_tasks
+from pyneng_cli.task_index import TaskIndex, ExercisesIndex, is_cross_chapter_selector
 from pyneng_cli.utils import (
     red,
     green,
     save_changes_to_github,
     current_chapter_id,
     current_dir_name,
-    parse_json_report,
     copy_answers,
+    start_fetch_answers,
     update_tasks_and_tests,
     update_chapters_tasks_and_tests,
 )
 
+# key of the TASKS argument string in click context meta
+TASKS_SELECTOR = "pyneng_cli.tasks_selector"
+
 
 def exception_handler(exception_type, exception, traceback):
     """
@@ -48,43 +51,39 @@ def check_current_dir_name(dir_list, message):
         raise click.Abort()
 
 
-def _get_tasks_tests_from_cli(self, value):
-    regex = (
-        r"(?P<all>all)|"
-        r"(?P<number_star>\d\*)|"
-        r"(?P<letters_range>\d[a-i]-[a-i])|"
-        r"(?P<numbers_range>\d-\d)|"
-        r"(?P<single_task>\d[a-i]?)"
-    )
-    tasks_list = re.split(r"[ ,]+", value)
-    current_chapter = current_chapter_id()
-    test_files = []
-    task_files = []
-    for task in tasks_list:
-        match = re.fullmatch(regex, task)
-        if match:
-            if task == "all":
-                test_files = sorted(glob(f"test_task_{current_chapter}_*.py"))
-                task_files = sorted(glob(f"task_{current_chapter}_*.py"))
-                break
-            else:
-                if match.group("letters_range"):
-                    task = f"{task[0]}[{task[1:]}]"  # convert 1a-c to 1[a-c]
-                elif match.group("numbers_range"):
-                    task = f"[{task}]"  # convert 1-3 to [1-3]
+def _get_tasks_tests_from_cli(self, value, chapter_dir="."):
+    """
+    The function resolves the task selector (1,2a,1-3,2a-c,2*,all) against the
+    index of the chapter directory and returns test files, tasks without
+    tests and task files.
+    """
+    index = TaskIndex(chapter_dir, current_chapter_id(chapter_dir))
+    try:
+        return index.select(value)
+    except ValueError as error:
+        self.fail(
+            red(
+                f"This format is not supported {error}. "
+                "Acceptable formats are listed in pyneng --help"
+            )
+        )
 
-                test_files += glob(f"test_task_{current_chapter}_{task}.py")
-                task_files += glob(f"task_{current_chapter}_{task}.py")
-        else:
-            self.fail(
-                red(
-                    f"This format is not supported {task}. "
-                    "Acceptable formats are listed in pyneng --help"
-                )
+
+def _get_chapters_tasks_tests_from_cli(self, value, exercises_dir="."):
+    """
+    The function resolves cross-chapter selectors (4.1,4.*,4.1-5.3) in the
+    exercises directory. Returns a dict {chapter directory: (test files,
+    tasks without tests, task files)}.
+    """
+    try:
+        return ExercisesIndex(exercises_dir).select(value)
+    except ValueError as error:
+        self.fail(
+            red(
+                f"This format is not supported {error}. "
+                "Acceptable formats are listed in pyneng --help"
             )
-    tasks_with_tests = set([test.replace("test_", "") for test in test_files])
-    tasks_without_tests = set(task_files) - tasks_with_tests
-    return sorted(test_files), sorted(tasks_without_tests), sorted(task_files)
+        )
 
 
 class CustomTasksType(click.ParamType):
@@ -93,22 +92,43 @@ class CustomTasksType(click.ParamType):
     options into separate test files.
 
     In addition, it checks whether there is such a file in the current
-    directory and leaves only those that are.
+    directory and leaves only those that are. The selector string itself is
+    kept in the context (see tasks_selector), because with --grade and
+    --chapters it is applied to each chapter.
     """
 
     name = "CustomTasksType"
 
     def convert(self, value, param, ctx):
-        if isinstance(value, tuple):
-            return value
-        elif value == "all" and current_dir_name() == "exercises":
+        if isinstance(value, (tuple, dict)):
             return value
-        elif current_dir_name() not in TASK_DIRS:
+        if ctx is not None:
+            ctx.meta[TASKS_SELECTOR] = value
+        dir_name = current_dir_name()
+        if dir_name == "exercises" and is_cross_chapter_selector(value):
+            return _get_chapters_tasks_tests_from_cli(self, value)
+        elif dir_name not in TASK_DIRS + DB_TASK_DIRS:
             return value
 
         return _get_tasks_tests_from_cli(self, value)
 
 
+def tasks_selector(default="all"):
+    """
+    Returns the TASKS argument as it was passed on the command line.
+    """
+    return click.get_current_context().meta.get(TASKS_SELECTOR, default)
+
+
+def check_tasks_selected(tasks):
+    """
+    Aborts if the selector (converted by CustomTasksType) matches no tasks.
+    """
+    if not tasks or not any(tasks):
+        print(red(f"\nThere are no tasks {tasks_selector()} in the current directory"))
+        raise click.Abort()
+
+
 class CustomChapterType(click.ParamType):
     name = "Chapters"
 
@@ -144,12 +164,81 @@ class CustomChapterType(click.ParamType):
 
 
 def print_docs_with_pager(width=90):
+    # rich is imported only when the documentation is shown
+    from rich.console import Console
+    from rich.markdown import Markdown
+
     console = Console(width=width)
     md = Markdown(DOCS)
     with console.pager():
         console.print(md)
 
 
+def _chapter_jobs(chapters, selector, files=0):
+    """
+    Converts a list of tuples (repository directory, chapter directory) to
+    the jobs of grade_chapters: tuples (repository directory, chapter
+    directory, files selected by selector). files is the index of the files
+    in the tuple of _get_tasks_tests_from_cli (0 - test files, 2 - task
+    files). Cross-chapter selectors (4.1-5.3) are resolved against the
+    exercises directory of each chapter.
+    """
+    cross_chapter = is_cross_chapter_selector(selector)
+    exercises_tasks = {}
+    chapter_jobs = []
+    for repo_dir, chapter_dir in chapters:
+        if cross_chapter:
+            exercises_dir, chapter = os.path.split(os.path.normpath(chapter_dir))
+            exercises_dir = exercises_dir or os.curdir
+            if exercises_dir not in exercises_tasks:
+                exercises_tasks[exercises_dir] = _get_chapters_tasks_tests_from_cli(
+                    CustomTasksType(), selector, exercises_dir
+                )
+            selected = exercises_tasks[exercises_dir].get(chapter, ([], [], []))
+        else:
+            selected = _get_tasks_tests_from_cli(
+                CustomTasksType(), selector, chapter_dir
+            )
+        chapter_jobs.append((repo_dir, chapter_dir, selected[files]))
+    return chapter_jobs
+
+
+def run_chapter_tests(
+    tasks, pytest_args, jobs, no_cache=False, answer=False, sandbox=None
+):
+    """
+    The function runs the tests of the current chapter directory and copies
+    the answers for the passed tasks if answer is True. sandbox
+    (SandboxLimits) runs each test file in a sandbox worker.
+    """
+    test_files, tasks_without_tests, task_files = tasks
+
+    # the answers are downloaded in the background while the tests are running
+    answers_fetch = start_fetch_answers() if answer else None
+
+    # the durations of the tests are collected only for the run history
+    if history.enabled():
+        pytest_args = [*pytest_args, "--test-durations"]
+
+    # run pytest (test files are distributed across processes if jobs > 1).
+    # Tasks that passed the tests and have not changed since then are not
+    # tested again unless --no-cache is added
+    if no_cache:
+        results = run_pytest_parallel(test_files, pytest_args, jobs, sandbox)
+    else:
+        results = run_pytest_cached(test_files, pytest_args, jobs, sandbox)
+    history.add_results(results)
+
+    # passed_tasks are tasks that have tests and passed tests
+    passed_tasks = get_passed_tasks(results)
+
+    if passed_tasks or tasks_without_tests:
+        # copy answers to answer_task_x.py files
+        if answer:
+            copy_answers(passed_tasks, answers_fetch)
+    return passed_tasks
+
+
 @click.command(
     context_settings=dict(
         ignore_unknown_options=True, help_option_names=["-h", "--help"]
@@ -193,6 +282,179 @@ def print_docs_with_pager(width=90):
     help="Add git add .",
 )
 @click.option("--ignore-ssl-cert", default=False)
+@click.option(
+    "--grade",
+    "grade_roots",
+    multiple=True,
+    type=click.Path(exists=True, file_okay=False),
+    help=(
+        "Run tests in all exercises/NN_* chapters found in the directory "
+        "(can be repeated)"
+    ),
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    help=(
+        "Run test files in parallel in the specified number of processes "
+        "(for --grade the default is the number of CPUs)"
+    ),
+)
+@click.option(
+    "--task-fail-fast",
+    is_flag=True,
+    help="Skip the remaining tests of a task after its first failed test",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Re-run the tests of a task every time the task or test file is saved",
+)
+@click.option(
+    "--daemon",
+    "start_daemon",
+    is_flag=True,
+    help=(
+        "Start pyneng daemon that keeps pytest and other modules imported, "
+        "so that pyneng calls start faster"
+    ),
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Run all tests, even for tasks that have not changed since they passed",
+)
+@click.option(
+    "--sandbox",
+    is_flag=True,
+    help=(
+        "Run each test file in a separate worker process with a timeout "
+        "and memory limit (a hanging task does not block the other tasks)"
+    ),
+)
+@click.option(
+    "--task-timeout",
+    type=click.IntRange(min=1),
+    default=60,
+    show_default=True,
+    help="Timeout in seconds for the tests of one task (with --sandbox)",
+)
+@click.option(
+    "--task-memory",
+    type=click.IntRange(min=0),
+    default=1024,
+    show_default=True,
+    help="Memory limit in MB for the tests of one task, 0 - no limit (with --sandbox)",
+)
+@click.option(
+    "--worker-max-tasks",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Restart a sandbox worker after this number of tasks (with --sandbox)",
+)
+@click.option(
+    "--timings",
+    "show_timings",
+    is_flag=True,
+    help="Show how long each phase of the run took (imports, tests, git)",
+)
+@click.option(
+    "--timings-trace",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the timings to a Chrome trace file (implies --timings)",
+)
+@click.option(
+    "--report-file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the result of each task to the file as soon as it is tested",
+)
+@click.option(
+    "--report-format",
+    type=click.Choice(task_report.REPORT_FORMATS),
+    default="jsonl",
+    show_default=True,
+    help="Format of --report-file",
+)
+@click.option(
+    "--chapters",
+    type=CustomChapterType(),
+    help=(
+        "Run the tests of the chapters (4-12, 4,5,7) in parallel, "
+        "one process per chapter. Used in the exercises directory"
+    ),
+)
+@click.option(
+    "--prefetch-store",
+    type=click.Path(file_okay=False, writable=True),
+    help=(
+        "Download the tasks and answers repositories to a shared store "
+        "directory (used by pyneng when PYNENG_STORE is set)"
+    ),
+)
+@click.option(
+    "--serve-store",
+    type=click.Path(exists=True, file_okay=False),
+    help="Serve the shared store directory over HTTP",
+)
+@click.option(
+    "--store-port",
+    type=click.IntRange(min=1, max=65535),
+    default=8000,
+    show_default=True,
+    help="Port for --serve-store",
+)
+@click.option(
+    "--fast-db",
+    is_flag=True,
+    help=(
+        "Run the tests of 25_db tasks in a temporary copy of the task directory "
+        "on tmpfs (the database files are not written to disk)"
+    ),
+)
+@click.option(
+    "--sim-devices",
+    type=click.IntRange(min=1),
+    help="Number of simulated devices for the pyneng_devices fixture (10 by default)",
+)
+@click.option(
+    "--sim-latency",
+    type=click.FloatRange(min=0),
+    help="Delay in seconds for each command of the simulated devices",
+)
+@click.option(
+    "--no-template-cache",
+    is_flag=True,
+    help=(
+        "Do not cache parsed TextFSM and compiled Jinja2 templates "
+        "in 20_jinja2 and 21_textfsm chapters"
+    ),
+)
+@click.option(
+    "--stats",
+    "show_stats",
+    is_flag=True,
+    help=(
+        "Show the statistics of the run history for the chapters in the "
+        "current directory: slowest tasks, regressions, flaky tests, time to green"
+    ),
+)
+@click.option(
+    "--scaling",
+    is_flag=True,
+    help=(
+        "Measure the speedup of 19_concurrent_connections tasks with 1, 2, 4 ... "
+        "N workers on simulated devices (with --grade for all repositories)"
+    ),
+)
+@click.option(
+    "--scaling-workers",
+    type=click.IntRange(min=2),
+    default=8,
+    show_default=True,
+    help="Maximum number of workers (and devices) for --scaling",
+)
 @click.version_option(version="5.1.0")
 def cli(
     tasks,
@@ -207,6 +469,31 @@ def cli(
     save_all_to_github,
     update_chapters,
     docs,
+    jobs,
+    no_cache,
+    grade_roots,
+    task_fail_fast,
+    watch,
+    start_daemon,
+    sandbox,
+    task_timeout,
+    task_memory,
+    worker_max_tasks,
+    show_timings,
+    timings_trace,
+    report_file,
+    report_format,
+    prefetch_store,
+    serve_store,
+    store_port,
+    chapters,
+    fast_db,
+    scaling,
+    scaling_workers,
+    show_stats,
+    sim_devices,
+    sim_latency,
+    no_template_cache,
 ):
     """
     PYNENG-CLI: Run tests for TASKS tasks. By default, all tests will run.
@@ -219,6 +506,12 @@ def cli(
      pyneng --update --test-only   Update only tests in the current directory
      pyneng 1,2 --update           Update tasks 1 and 2 and corresponding tests in current directory
      pyneng --update-chapters 4-5  Update chapters 4 and 5 (directories will be removed and updated versions copied)
+     pyneng --grade students/      Run tests in all chapters of all repositories in students/
+     pyneng --daemon               Start pyneng daemon (pyneng calls are faster while it is running)
+     pyneng --prefetch-store DIR   Download tasks and answers to a shared store for PYNENG_STORE
+     pyneng --serve-store DIR      Serve the shared store over HTTP
+     pyneng --stats                Show the slowest tasks, regressions and flaky tests from the run history
+     pyneng --scaling              Measure the speedup of 19 chapter tasks with more workers
 
     \b
     Run tests, view answers
@@ -229,10 +522,34 @@ def cli(
          pyneng 1,3-5       run tests for tasks 1, 3, 4, 5
          pyneng 1-5 -a      run the tests and write the answers for the tasks
                             that passed the tests to the files answer_task_x.py
+         pyneng -j 8        run test files in parallel in 8 processes
+         pyneng --sandbox   run each test file with a timeout and memory limit
+         pyneng --timings   show how long imports, tests and git commands took
+         pyneng --report-file results.jsonl
+                            write the result of each task to results.jsonl
+         pyneng 1-5 --watch run the tests and re-run the tests of a task
+                            every time the task is saved
+
+    \b
+    In the exercises directory
+         pyneng all         run tests for all chapters (a process per chapter)
+         pyneng --chapters 4-12
+                            run tests for chapters 4 to 12 (a process per chapter)
+         pyneng 4.1-5.3     run tests for tasks from 4.1 to 5.3
+         pyneng 4.*,7.2a    run tests for all tasks of chapter 4 and task 7.2a
 
     \b
     Read more in the documentation: pyneng --docs
     """
+    if show_timings or timings_trace:
+        timings.enable()
+        # the breakdown is printed however the command ends
+        click.get_current_context().call_on_close(lambda: timings.finish(timings_trace))
+
+    if report_file:
+        task_report.open_report(report_file, report_format)
+        click.get_current_context().call_on_close(task_report.close_report)
+
     global DEFAULT_BRANCH
     if default_branch != "main":
         DEFAULT_BRANCH = default_branch
@@ -241,6 +558,26 @@ def cli(
         print_docs_with_pager()
         return
 
+    if start_daemon:
+        from pyneng_cli.daemon import serve
+
+        serve()
+        return
+
+    if prefetch_store or serve_store:
+        from pyneng_cli import store
+
+        if prefetch_store:
+            store.prefetch_store(prefetch_store)
+            print(green(f"Store {prefetch_store} is up to date"))
+        if serve_store:
+            store.serve_store(serve_store, store_port)
+        return
+
+    if show_stats:
+        history.print_stats()
+        return
+
     if save_all_to_github:
         save_changes_to_github(branch=DEFAULT_BRANCH)
         print(green("All changes in the current directory are saved to GitHub"))
@@ -259,12 +596,100 @@ def cli(
         )
         return
 
-    # it makes sense to perform further actions only if we are in the directory
-    # of a specific task chapter
+    sandbox_limits = None
+    if sandbox:
+        from pyneng_cli.sandbox import SandboxLimits
+
+        sandbox_limits = SandboxLimits(
+            timeout=task_timeout,
+            memory_mb=task_memory,
+            max_tasks_per_worker=worker_max_tasks,
+        )
+
+    grade_pytest_args = []
+    if task_fail_fast:
+        grade_pytest_args.append("--task-fail-fast")
+    if fast_db:
+        grade_pytest_args.append("--fast-db")
+    if no_template_cache:
+        grade_pytest_args.append("--no-template-cache")
+    if sim_devices is not None:
+        grade_pytest_args.append(f"--sim-devices={sim_devices}")
+    if sim_latency is not None:
+        grade_pytest_args.append(f"--sim-latency={sim_latency}")
+    if history.enabled():
+        grade_pytest_args.append("--test-durations")
+        # the records of the run are written at once when the run ends
+        click.get_current_context().call_on_close(history.save)
+
+    # tasks are converted to files only in a chapter directory, with --grade
+    # and --chapters and in the exercises directory the selector is applied
+    # to each chapter
+    selector = tasks_selector()
+    if scaling:
+        from pyneng_cli.scaling import SCALING_CHAPTER, scale_chapters
+
+        if grade_roots:
+            chapter_jobs = _chapter_jobs(
+                [
+                    (repo_dir, chapter_dir)
+                    for repo_dir, chapter_dir in find_chapters(grade_roots)
+                    if os.path.basename(chapter_dir) == SCALING_CHAPTER
+                ],
+                selector,
+                files=2,
+            )
+        else:
+            check_current_dir_name(
+                [SCALING_CHAPTER], "Scaling can only be measured from the directory"
+            )
+            chapter_jobs = [(os.curdir, os.curdir, tasks[2])]
+        scale_chapters(chapter_jobs, scaling_workers)
+        return
+
+    # pyneng all, cross-chapter selectors (4.1-5.3) and --chapters 4-12 in the
+    # exercises directory run each chapter in a separate process like --grade
+    in_exercises = current_dir_name() == "exercises"
+    exercises_mode = chapters or (in_exercises and not update_tasks_tests)
+    if (grade_roots or exercises_mode) and answer:
+        print(
+            red(
+                "\nAnswers (-a) can only be copied in a chapter directory, "
+                "not with --grade, --chapters or in the exercises directory"
+            )
+        )
+        raise click.Abort()
+
+    if grade_roots:
+        grade_chapters(
+            _chapter_jobs(find_chapters(grade_roots), selector),
+            jobs=jobs or os.cpu_count(),
+            pytest_args=grade_pytest_args,
+            sandbox=sandbox_limits,
+        )
+        return
+
+    if exercises_mode:
+        check_current_dir_name(
+            ["exercises"], "Chapters can only be tested from the directory"
+        )
+        if isinstance(tasks, dict):
+            check_tasks_selected(tasks)
+        chapter_dirs = exercises_chapters(os.curdir, chapters)
+        grade_chapters(
+            _chapter_jobs([(os.curdir, d) for d in chapter_dirs], selector),
+            jobs=jobs or os.cpu_count(),
+            pytest_args=grade_pytest_args,
+            sandbox=sandbox_limits,
+            use_cache=not no_cache,
+        )
+        return
+
+    # it makes sense to perform further actions only if we are in the
+    # directory of a specific task chapter
     check_current_dir_name(
         TASK_DIRS + DB_TASK_DIRS, "Tasks can only be tested from directories"
     )
-
     test_files, tasks_without_tests, task_files = tasks
 
     if update_tasks_tests:
@@ -284,12 +709,22 @@ def cli(
         if upd:
             print(msg)
         return
+    check_tasks_selected(tasks)
 
     if not debug:
         sys.excepthook = exception_handler
 
-    json_plugin = JSONReport()
-    pytest_args_common = ["--json-report-file=none", "--disable-warnings"]
+    pytest_args_common = ["--disable-warnings"]
+    if task_fail_fast:
+        pytest_args_common.append("--task-fail-fast")
+    if fast_db:
+        pytest_args_common.append("--fast-db")
+    if no_template_cache:
+        pytest_args_common.append("--no-template-cache")
+    if sim_devices is not None:
+        pytest_args_common.append(f"--sim-devices={sim_devices}")
+    if sim_latency is not None:
+        pytest_args_common.append(f"--sim-latency={sim_latency}")
 
     if disable_verbose:
         pytest_args = [*pytest_args_common, "--tb=short"]
@@ -301,17 +736,15 @@ def cli(
     if answer:
         pytest_args = [*pytest_args_common, "--tb=no"]
 
-    # run pytest
-    pytest.main(test_files + pytest_args, plugins=[json_plugin])
+    run_chapter_tests(
+        tasks, pytest_args, jobs or 1, no_cache, answer, sandbox=sandbox_limits
+    )
 
-    # get pytest results in JSON format passed_tasks are tasks that have tests
-    # and passed tests
-    passed_tasks = parse_json_report(json_plugin.report)
+    if watch:
+        # imported here because this module is needed only with --watch
+        from pyneng_cli.watch import watch_chapter
 
-    if passed_tasks or tasks_without_tests:
-        # copy answers to answer_task_x.py files
-        if answer:
-            copy_answers(passed_tasks)
+        watch_chapter(test_files, pytest_args)
 
     # if the --all flag is added, all changes must be saved to github
     if git_add_all_to_github:
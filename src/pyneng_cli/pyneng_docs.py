@@ -59,6 +59,97 @@ or so to run all 7.2x tasks with and without letters:
 pyneng 2*
 ```
 
+In the exercises directory, tasks of several chapters can be checked with
+one command. The chapter number is specified before the task number:
+
+```
+pyneng 4.1-5.3
+pyneng 4.*,7.2a
+```
+
+4.1-5.3 includes all tasks from 4.1 to 5.3 (including tasks with letters),
+4.* means all tasks of chapter 4. Like ``pyneng all``, each chapter is tested
+in a separate process and the result is printed for each chapter.
+
+In the exercises directory ``pyneng all`` runs the tests of all chapters,
+``--chapters`` selects the chapters (the same format as ``--update-chapters``).
+Each chapter is tested in a separate process in parallel (as many processes
+as there are CPUs, can be changed with ``-j``) and the result is printed for
+each chapter (answers are copied with ``-a`` only in a chapter directory):
+
+```
+pyneng all
+pyneng --chapters 4-12
+```
+
+Tasks that passed the tests are not tested again while the task file, the
+test file, conftest.py of the chapter, the templates directory in 20_jinja2
+and 21_textfsm chapters (all files of the task directory in 25_db), Python
+and pyneng versions stay the same, pyneng shows them as cached. Changes of
+the other tasks and their answers do not affect the cached result. Tests
+without a task file are always run. To run all tests anyway, add
+``--no-cache``:
+
+```
+pyneng --no-cache
+```
+
+
+A task passes only if all its tests pass, so with ``--task-fail-fast`` the
+remaining tests of a task are skipped after its first failed test (tests of
+other tasks still run):
+
+```
+pyneng --task-fail-fast
+```
+
+
+With ``--sandbox`` each test file runs in a separate worker process with a
+timeout (``--task-timeout``, 60 seconds by default) and a memory limit
+(``--task-memory``, 1024 MB by default). A task with an infinite loop or a
+task that uses too much memory is reported as ``timeout`` or
+``resource-limit`` and the other tasks are tested as usual. Workers are
+restarted after ``--worker-max-tasks`` tasks. ``--sandbox`` also works with
+``-j`` and ``--grade``:
+
+```
+pyneng --sandbox --task-timeout 10
+```
+
+
+With ``--timings`` pyneng prints at the end how long each phase took:
+imports, pytest collection, tests of each task, git commands (fetching
+answers and tasks, push). ``--timings-trace FILE`` also writes the timings
+to a Chrome trace file that can be opened in chrome://tracing or
+https://ui.perfetto.dev:
+
+```
+pyneng --timings
+pyneng -j 4 --timings-trace trace.json
+```
+
+
+``--report-file FILE`` writes the result of each task to FILE as soon as
+its tests are finished: task, chapter, outcome (passed, failed, error,
+skipped, timeout...), duration and a one line summary of each failure. With
+``--grade`` the records also have the repository of the chapter (``repo``).
+``--report-format`` selects the format: ``jsonl`` (one JSON object per
+line, the default) or ``junit`` (JUnit XML for CI systems):
+
+```
+pyneng --report-file results.jsonl
+pyneng 4.*,5.* --report-file results.xml --report-format junit
+```
+
+
+With ``--watch`` pyneng runs the tests and then keeps watching the chapter
+directory: every time a task or its test file is saved, only the tests of
+this task are run again. Press Ctrl-C to exit:
+
+```
+pyneng 1-5 --watch
+```
+
 
 ## Getting answers to tasks
 
@@ -75,6 +166,12 @@ Tests will run for the specified tasks, and for those tasks that pass the
 tests, the answers will be copied to the answer_task_x.py files in the current
 directory.
 
+The answers repository is kept in the ~/.pyneng-answers directory (shallow
+clone that contains only the chapters for which answers were requested), so
+a repeated ``pyneng -a`` does not download the answers again. The local copy
+is updated from GitHub if it is older than one hour, this time (in seconds)
+can be changed with the PYNENG_CACHE_TTL environment variable.
+
 Answer files are not added to github by default. They can be:
 
 * deleted
@@ -84,6 +181,166 @@ Answer files are not added to github by default. They can be:
 It makes sense to add files to git if you write something in them. For example,
 comments for yourself on some difficult points.
 
+## pyneng daemon
+
+Every pyneng call imports pytest and other modules before the tests are
+run. To avoid this, start the pyneng daemon in a separate terminal (Linux and
+macOS):
+
+```
+pyneng --daemon
+```
+
+While the daemon is running, pyneng calls are sent to it and each call is
+executed in a new process forked from the daemon, with the current directory,
+environment and terminal of the call. If the daemon is not running, pyneng
+works as usual. The daemon is stopped with Ctrl-C.
+
+The daemon socket is created in the directory ``pyneng-<uid>`` of
+``$XDG_RUNTIME_DIR`` (or of the temporary directory), which must belong to
+the current user and be closed to other users, otherwise the calls are not
+sent to the daemon. The daemon runs only the calls of pyneng installed in
+the same Python environment (virtual environment), pyneng of another
+environment needs its own daemon.
+
+## Run history and statistics
+
+pyneng saves the result of each tested task to a local SQLite history
+(``~/.cache/pyneng/history.sqlite``): task, outcome, duration, hash of the
+task file and its test file, time of the run and the outcome and duration of
+each test. The records of a run are written at once when the run ends, so
+the history does not slow down the tests. Tasks that were not tested again because their
+passed result is cached are not added. The file can be changed with the
+environment variable ``PYNENG_HISTORY`` (for example, one history for a
+grading environment), an empty value disables the history.
+
+``pyneng --stats`` shows the statistics for the chapters in the current
+directory and its subdirectories:
+
+* slowest tasks - average and maximum duration of a run
+* regressions - runs that failed after a passed run (and whether the task
+  file has changed since then)
+* flaky tests - tests that passed and failed with the same task file
+* time to green - time from the first run of a task to the first passed run
+
+## Fast database tests
+
+The tests of 25_db tasks create and query SQLite files in the task
+directory. On slow or network file systems each commit waits for the disk,
+and ``--fast-db`` removes this cost:
+
+```
+pyneng --fast-db
+pyneng --fast-db -j 4
+```
+
+The tests of the task directory are run in its temporary copy on tmpfs
+(``/dev/shm``) with relaxed SQLite journaling (``synchronous=OFF``,
+``journal_mode=MEMORY``). Each run (and each process with ``-j``) uses its
+own copy, so the database files are not shared. The results are the same,
+but the database files created by the tests are removed with the copy and
+do not appear in the task directory.
+
+## Template cache
+
+The tests of 20_jinja2 and 21_textfsm chapters call the task functions many
+times, and each call parses the same TextFSM template or compiles the same
+Jinja2 template again. In these chapters pyneng caches the parsed TextFSM
+templates and the compiled Jinja2 templates by the hash of the template
+content (Jinja2 environments created with their own ``bytecode_cache`` are
+not changed). The TextFSM cache depends on the internals of the textfsm
+package: if the installed textfsm version does not have them, TextFSM
+templates are parsed as usual. The compiled Jinja2 templates are also saved to
+``~/.cache/pyneng/templates``, so the next runs and the parallel processes
+(``-j``) do not compile them again. The cache can be disabled with
+``--no-template-cache``:
+
+```
+pyneng --no-template-cache
+```
+
+## Simulated devices
+
+Tasks of chapters 18_ssh_telnet and 19_concurrent_connections connect to
+network devices. For tests without real devices pyneng has a built-in
+simulator of Cisco-like devices: each device listens on its own localhost
+port, supports login, enable mode (username, password and secret are
+``cisco``), configuration mode and canned show commands (show version,
+show ip interface brief, show running-config, show clock). Telnet works
+out of the box, SSH requires asyncssh (``pip install pyneng-cli[simulator]``).
+
+The simulator is started for the test run when a test uses the
+``pyneng_devices`` fixture (a list of netmiko parameters of the devices) or
+``pyneng_simulator``. The number of devices and the delay of each command
+can be changed with ``--sim-devices`` and ``--sim-latency``:
+
+```
+pyneng 1 --sim-devices 5 --sim-latency 0.5
+```
+To experiment with the devices manually:
+
+```
+python -m pyneng_cli.device_simulator --devices 5 --latency 0.5
+```
+
+### Scaling of concurrent connections
+
+``pyneng --scaling`` in the 19_concurrent_connections directory calls the
+functions of tasks 19.2, 19.3 and 19.4 with simulated devices (each command
+takes 0.2 seconds) and ``limit`` 1, 2, 4 ... 8 (the maximum is set with
+``--scaling-workers``). For each number of workers the wall time, speedup
+(time with 1 worker divided by the time) and parallel efficiency (speedup
+divided by the number of workers) are printed. If the speedup with the
+maximum number of workers is less than 1.5, the task is marked as
+serialized: most likely it connects to the devices one by one, for example,
+it waits for the result of each future right after submit.
+
+With ``--grade`` the scaling is measured for the 19_concurrent_connections
+chapter of each repository (one repository at a time, so that the
+measurements do not affect each other):
+
+```
+pyneng --scaling --grade students/
+```
+
+## Grading many repositories
+
+``--grade`` finds all exercises/NN_* chapters in the specified directories
+(for example, a directory with the cloned repositories of all students) and
+runs the tests of each chapter in a pool of processes (by default, as many as
+there are CPUs, can be changed with ``-j``). Task selection works the same as
+in the chapter directory:
+
+```
+pyneng --grade students/
+pyneng 1-3 --grade students/alice --grade students/bob -j 8
+```
+
+The result is printed for each chapter, followed by a summary for each
+repository.
+
+## Shared store for a classroom
+
+Instead of each student downloading the tasks and answers from GitHub,
+one machine can download them once to a shared store (a directory with
+mirrors of the repositories):
+
+```
+pyneng --prefetch-store /mnt/course/pyneng-store
+```
+
+The store can be used from a shared mount or served over HTTP by pyneng:
+
+```
+pyneng --serve-store /mnt/course/pyneng-store --store-port 8000
+```
+
+Students set the PYNENG_STORE environment variable to the directory or URL
+of the store, for example ``export PYNENG_STORE=http://192.168.1.10:8000``.
+pyneng then downloads tasks and answers from the store and goes to GitHub
+only if the store is not available. Git checks the hash of every object
+received from the store. Run ``--prefetch-store`` again to update the store.
+
 ## Upload all changes in the current directory to github, regardless of whether the tests pass
 
 ```
@@ -101,10 +358,14 @@ git push origin main
 ## Chapter update
 
 Pyneng has two options for updating: updating by chapters or by specific
-tasks/tests. When a chapter is updated, the chapter's directory is deleted
-and the new version is copied. This is only suitable for chapters that you
-haven't started doing yet. If you need to update a specific task, it is better
-to use the update of specific tasks (discussed later).
+tasks/tests. When a chapter is updated for the first time, the chapter's
+directory is replaced with the new version. On the next updates only the files
+that have changed in the tasks repository since the previous update of the
+chapter are copied, other files of the chapter are not touched. The new version
+of the chapter is prepared next to it and then replaced in one step, so an
+interrupted update does not leave a half-deleted chapter. Chapter update is
+suitable for chapters that you haven't started doing yet. If you need to update
+a specific task, it is better to use the update of specific tasks (discussed later).
 
 Before any upgrade option, it is advisable to save all local changes to github!
 
@@ -136,6 +397,14 @@ General logic:
 * tasks and tests are copied from the repository
 * the entire task file is copied, not just the description, so the file will be overwritten
 * before doing --update, it's better to save all changes on github
+* the tasks repository is kept locally as a shallow clone that contains only the
+  updated chapters, it is fetched from GitHub only if the local copy is older
+  than PYNENG_CACHE_TTL seconds (one hour by default, ``PYNENG_CACHE_TTL=0 pyneng --update``
+  always fetches the latest version)
+* git status of the repository uses the untracked cache and the fsmonitor of the
+  user's git config. On Windows and macOS with git 2.36 or newer
+  ``PYNENG_GIT_FSMONITOR=1`` enables the git builtin fsmonitor daemon for the
+  repository (the daemon keeps running after pyneng exits)
 
 How --update works
 
@@ -0,0 +1,120 @@
+"""
+pytest plugin with pyneng options. It is registered by pyneng for every test
+run, so the options can be passed in pytest arguments (including the runs in
+worker processes).
+"""
+
+import os
+
+import pytest
+
+from pyneng_cli import DB_TASK_DIRS, TEMPLATE_CHAPTERS
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("pyneng")
+    group.addoption(
+        "--task-fail-fast",
+        action="store_true",
+        default=False,
+        help="Skip the remaining tests of a test file after its first failure",
+    )
+    group.addoption(
+        "--sim-devices",
+        type=int,
+        default=10,
+        help="Number of simulated devices for pyneng_devices fixture",
+    )
+    group.addoption(
+        "--sim-latency",
+        type=float,
+        default=0.0,
+        help="Delay in seconds for each command of the simulated devices",
+    )
+    group.addoption(
+        "--test-durations",
+        action="store_true",
+        default=False,
+        help="Save the outcome and duration of each test (for the run history)",
+    )
+    group.addoption(
+        "--fast-db",
+        action="store_true",
+        default=False,
+        help=(
+            "Run the tests of 25_db task directories in a copy of the directory "
+            "on tmpfs with relaxed SQLite journaling"
+        ),
+    )
+    group.addoption(
+        "--no-template-cache",
+        action="store_true",
+        default=False,
+        help=(
+            "Do not cache parsed TextFSM and compiled Jinja2 templates "
+            f"in {', '.join(TEMPLATE_CHAPTERS)} chapters"
+        ),
+    )
+
+
+def pytest_configure(config):
+    if config.getoption("task_fail_fast"):
+        config.pluginmanager.register(TaskFailFast(), "pyneng-task-fail-fast")
+    if config.getoption("fast_db") and os.path.basename(os.getcwd()) in DB_TASK_DIRS:
+        from pyneng_cli.fast_db import FastDB
+
+        config.pluginmanager.register(FastDB(), "pyneng-fast-db")
+    if (
+        not config.getoption("no_template_cache")
+        and os.path.basename(os.getcwd()) in TEMPLATE_CHAPTERS
+    ):
+        # textfsm and jinja2 are imported only for these chapters
+        from pyneng_cli.template_cache import install
+
+        install()
+
+
+class TaskFailFast:
+    """
+    The task is passed only if all tests in its test file pass, so after the
+    first failed test the remaining tests of this file are skipped. Tests in
+    other files are run as usual.
+    """
+
+    def __init__(self):
+        self.failed_files = set()
+
+    def pytest_runtest_logreport(self, report):
+        if report.failed:
+            self.failed_files.add(report.nodeid.split("::")[0])
+
+    def pytest_runtest_setup(self, item):
+        if item.nodeid.split("::")[0] in self.failed_files:
+            pytest.skip("previous test of the task failed (--task-fail-fast)")
+
+
+@pytest.fixture(scope="session")
+def pyneng_simulator(request):
+    """
+    Simulator of Cisco-like devices (see pyneng_cli.device_simulator). It is
+    started on first use and stopped at the end of the test run.
+    """
+    from pyneng_cli.device_simulator import DeviceSimulator
+
+    simulator = DeviceSimulator(
+        count=request.config.getoption("sim_devices"),
+        latency=request.config.getoption("sim_latency"),
+    )
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture(scope="session")
+def pyneng_devices(pyneng_simulator):
+    """
+    List of netmiko parameters of the simulated devices (SSH if asyncssh is
+    installed, otherwise telnet).
+    """
+    protocol = "ssh" if pyneng_simulator.ssh else "telnet"
+    return [device.netmiko_params(protocol) for device in pyneng_simulator.devices]
@@ -0,0 +1,202 @@
+import os
+import shutil
+import stat
+import time
+
+import click
+
+from pyneng_cli.exceptions import PynengError
+from pyneng_cli.git_backend import run_git
+from pyneng_cli.store import store_sources
+from pyneng_cli import CACHE_TTL, STORE
+
+FETCH_STAMP = "pyneng-last-fetch"
+
+
+def _remove_readonly(func, path, _):
+    os.chmod(path, stat.S_IWRITE)
+    func(path)
+
+
+def git_error(stderr):
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode("utf-8", errors="replace")
+    if "could not resolve host" in stderr.lower():
+        msg = "Failed to clone the repository. Maybe you don't have internet access?"
+    else:
+        msg = f"Failed to copy files. {stderr}"
+    return PynengError(click.style(msg, fg="red"))
+
+
+class GitRepoCache:
+    """
+    Persistent shallow clone of a git repository in the user's home directory.
+
+    Only the paths passed to sync are checked out (sparse checkout) and the
+    repository is fetched from the remote only when the last fetch is older
+    than ttl seconds. Files can be read directly from git objects with
+    read_files, so the working tree of the cache is never needed.
+
+    If store (PYNENG_STORE) is set, the repository is cloned and fetched from
+    the shared store first and from url only if the store is not available.
+    """
+
+    def __init__(self, url, path, ttl=CACHE_TTL, store=STORE):
+        self.url = url
+        self.path = str(path)
+        self.ttl = ttl
+        self.store = store
+
+    def _git(self, *args, input=None):
+        result = run_git(args, cwd=self.path, input=input)
+        if result.returncode != 0:
+            raise git_error(result.stderr)
+        return result.stdout
+
+    @property
+    def _stamp_file(self):
+        return os.path.join(self.path, ".git", FETCH_STAMP)
+
+    def exists(self):
+        return os.path.isdir(os.path.join(self.path, ".git"))
+
+    def is_fresh(self):
+        try:
+            last_fetch = os.path.getmtime(self._stamp_file)
+        except OSError:
+            return False
+        return time.time() - last_fetch < self.ttl
+
+    def is_sparse(self):
+        result = run_git(["config", "core.sparseCheckout"], cwd=self.path)
+        return result.stdout.strip() == b"true"
+
+    def is_partial(self):
+        result = run_git(["config", "remote.origin.promisor"], cwd=self.path)
+        return result.stdout.strip() == b"true"
+
+    def _touch_stamp(self):
+        with open(self._stamp_file, "w") as f:
+            f.write(str(time.time()))
+
+    def clone(self):
+        for source, git_config, shallow in store_sources(self.store, self.url):
+            if os.path.exists(self.path):
+                shutil.rmtree(self.path, onerror=_remove_readonly)
+            clone_args = ["--depth=1"] if shallow else []
+            if source == self.url:
+                # a partial clone fetches the missing blobs later from the
+                # remote it was cloned from. A clone from the store gets all
+                # blobs at once, otherwise --update fails when the store is
+                # not available
+                clone_args.append("--filter=blob:none")
+            result = run_git(
+                ["clone", *clone_args, "--sparse", source, self.path],
+                git_config=git_config,
+            )
+            if result.returncode == 0:
+                break
+        else:
+            raise git_error(result.stderr)
+        self._touch_stamp()
+
+    def fetch(self):
+        """
+        Incremental fetch of the latest commit of the remote default branch.
+        In a partial clone only the blobs of the sparse paths are downloaded
+        from the repository URL (a fetch from the store gets all blobs).
+        """
+        partial = self.is_partial()
+        for source, git_config, shallow in store_sources(self.store, self.url):
+            shallow_args = ["--depth=1"] if shallow else []
+            # the blob filter of the partial clone is configured for origin,
+            # a fetch by URL would download all blobs of the commit
+            remote = "origin" if partial and source == self.url else source
+            result = run_git(
+                ["fetch", *shallow_args, remote, "HEAD"],
+                cwd=self.path,
+                git_config=git_config,
+            )
+            if result.returncode == 0:
+                break
+        else:
+            raise git_error(result.stderr)
+        self._git("reset", "--hard", "--quiet", "FETCH_HEAD")
+        self._touch_stamp()
+
+    def sparse_paths(self):
+        if not self.is_sparse():
+            return None
+        output = self._git("sparse-checkout", "list").decode("utf-8")
+        return set(output.split())
+
+    def add_sparse_paths(self, paths):
+        current_paths = self.sparse_paths()
+        # a full (non-sparse) clone already contains all paths
+        if current_paths is None:
+            return
+        new_paths = [p for p in paths if p not in current_paths]
+        if new_paths:
+            self._git("sparse-checkout", "add", *new_paths)
+
+    def sync(self, paths=None, force=False):
+        """
+        Makes sure the cache exists, is not older than ttl and contains paths.
+        """
+        if not self.exists():
+            self.clone()
+        elif force or not self.is_fresh():
+            self.fetch()
+        if paths:
+            self.add_sparse_paths(paths)
+
+    def head(self):
+        return self._git("rev-parse", "HEAD").decode("utf-8").strip()
+
+    def changed_files(self, old_commit, path):
+        """
+        Returns a dict {file: git status letter} of files in path changed
+        between old_commit and HEAD or None if old_commit is not available
+        in the cache (for example, after a new clone).
+        """
+        result = run_git(["cat-file", "-e", f"{old_commit}^{{tree}}"], cwd=self.path)
+        if result.returncode != 0:
+            return None
+        output = self._git(
+            "diff",
+            "--name-status",
+            "-z",
+            "--no-renames",
+            old_commit,
+            "HEAD",
+            "--",
+            path,
+        ).decode("utf-8")
+        fields = output.split("\0")
+        # output format: status\0filename\0status\0filename\0
+        changed = dict(zip(fields[1::2], fields[0::2]))
+        return changed
+
+    def read_files(self, paths):
+        """
+        Reads files from HEAD of the cache directly from git objects.
+        Returns a dict {path: content as bytes}, missing files are skipped.
+        """
+        paths = list(paths)
+        if not paths:
+            return {}
+        batch_input = "".join(f"HEAD:{p}\n" for p in paths).encode("utf-8")
+        output = self._git("cat-file", "--batch", input=batch_input)
+        files = {}
+        position = 0
+        for path in paths:
+            end_of_header = output.index(b"\n", position)
+            header = output[position:end_of_header].split()
+            position = end_of_header + 1
+            if header[-1] == b"missing":
+                continue
+            size = int(header[2])
+            files[path] = output[position : position + size]
+            # content is followed by a newline
+            position += size + 1
+        return files
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import pathlib
+import platform
+
+from pyneng_cli import __version__, CACHE_DIR, DB_TASK_DIRS, TEMPLATE_CHAPTERS
+from pyneng_cli.results import file_passed
+
+RESULT_CACHE_DIR = "results"
+# directories of the chapter that are not task sources
+SKIP_DIRS = {"__pycache__", ".pytest_cache"}
+TEMPLATES_DIR = "templates"
+
+
+def file_hash(filename):
+    """
+    The function returns sha256 of the file contents or None if there is no
+    such file.
+    """
+    try:
+        with open(filename, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _is_test_file(name):
+    return name.startswith("test_") and name.endswith(".py")
+
+
+def sources_hash(directory):
+    """
+    The function returns sha256 of the names and contents of all files in
+    directory and its subdirectories except test files and hidden files:
+    task files, modules, templates and data files used by the tasks,
+    conftest.py. Returns None if there are no such files.
+    """
+    digest = hashlib.sha256()
+    found = False
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(
+            name for name in dirs if name not in SKIP_DIRS and not name.startswith(".")
+        )
+        for name in sorted(files):
+            if name.startswith(".") or name.endswith(".pyc") or _is_test_file(name):
+                continue
+            filename = os.path.join(root, name)
+            content_hash = file_hash(filename)
+            if content_hash is None:
+                continue
+            found = True
+            relative_name = os.path.relpath(filename, directory)
+            digest.update(f"{relative_name}\0{content_hash}\n".encode("utf-8"))
+    return digest.hexdigest() if found else None
+
+
+def chapter_sources_hash(chapter_path):
+    """
+    The function returns a hash of the sources of chapter_path shared by its
+    tasks: conftest.py, the templates directory of 20_jinja2 and 21_textfsm
+    chapters or all files of 25_db task directories, where the tasks consist
+    of several modules (see sources_hash).
+    """
+    chapter = os.path.basename(chapter_path)
+    if chapter in DB_TASK_DIRS:
+        return sources_hash(chapter_path)
+    parts = [file_hash(os.path.join(chapter_path, "conftest.py"))]
+    if chapter in TEMPLATE_CHAPTERS:
+        parts.append(sources_hash(os.path.join(chapter_path, TEMPLATES_DIR)))
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+def task_hash(chapter_path, test_file, shared_sources=None):
+    """
+    The function returns a hash of the task version tested by test_file: the
+    test file, the task file and the sources shared by the tasks of the
+    chapter (see chapter_sources_hash, can be passed if it is already
+    calculated for the directory). The other tasks of the chapter and their
+    answers are not a part of the hash.
+
+    Returns None if the task file is not found: task_x.py for test_task_x.py
+    or any source file in 25_db task directories.
+    """
+    if shared_sources is None:
+        shared_sources = chapter_sources_hash(chapter_path)
+    parts = [file_hash(os.path.join(chapter_path, test_file))]
+    if os.path.basename(chapter_path) not in DB_TASK_DIRS:
+        task_file = test_file.replace("test_", "", 1)
+        parts.append(file_hash(os.path.join(chapter_path, task_file)))
+    if shared_sources is None or None in parts:
+        return None
+    parts.append(shared_sources)
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache of passed test files for the chapter directory.
+
+    The key of the test file is a hash of the test file, the task file, the
+    sources shared by the tasks of the chapter (see task_hash), the Python
+    version and the pyneng version, so a change of the task, the templates
+    of the chapter or conftest.py invalidates the cached result, while the
+    results of the other tasks stay cached. The results of test files
+    without a task file are not cached.
+
+    The shared sources are hashed once, when the cache is loaded before the
+    tests, so the key is the version of the task that was tested.
+    """
+
+    def __init__(self, chapter_path=None, cache_dir=CACHE_DIR):
+        self.chapter_path = str(chapter_path or pathlib.Path().absolute())
+        chapter_id = hashlib.sha256(self.chapter_path.encode("utf-8")).hexdigest()
+        self.filename = os.path.join(
+            cache_dir, RESULT_CACHE_DIR, f"{chapter_id[:16]}.json"
+        )
+        self.results = self._load()
+        self._shared_sources = chapter_sources_hash(self.chapter_path)
+
+    def _load(self):
+        try:
+            with open(self.filename) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        tmp_filename = f"{self.filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(self.results, f)
+        os.replace(tmp_filename, self.filename)
+
+    def key(self, test_file):
+        """
+        Returns the cache key of test_file or None if the result of the test
+        file can not be cached.
+        """
+        version = task_hash(self.chapter_path, test_file, self._shared_sources)
+        if version is None:
+            return None
+        parts = [platform.python_version(), __version__, version]
+        return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+    def get(self, test_file):
+        """
+        Returns the cached result for test_file or None if the test file or
+        the task sources have changed.
+        """
+        cached = self.results.get(test_file)
+        if not cached:
+            return None
+        key = self.key(test_file)
+        if key is not None and cached["key"] == key:
+            return cached.get("result")
+        return None
+
+    def update(self, results):
+        """
+        Saves the test files in which all tests passed and removes from the
+        cache the files that failed.
+        """
+        if not results:
+            return
+        for test_file, file_result in results.items():
+            key = self.key(test_file)
+            if key is not None and file_passed(file_result):
+                # the tests of the file are needed only for the run history
+                result = {k: v for k, v in file_result.items() if k != "tests"}
+                self.results[test_file] = {"key": key, "result": result}
+            else:
+                self.results.pop(test_file, None)
@@ -0,0 +1,134 @@
+OUTCOMES = ("passed", "failed", "skipped", "errors")
+
+
+def new_file_result():
+    result = dict.fromkeys(OUTCOMES, 0)
+    result["duration"] = 0.0
+    return result
+
+
+class ResultsCollector:
+    """
+    pytest plugin that collects the results of a test run per test file.
+
+    Only counters are stored for each file (number of passed, failed, skipped
+    tests and errors, total duration), so the memory does not depend on the
+    number of tests. Files with failed tests also get a "failures" list with
+    one line summary of each failure. The results are available in the
+    results attribute:
+
+    {"test_task_4_1.py": {"passed": 2, "failed": 0, "skipped": 0,
+                          "errors": 0, "duration": 0.01}}
+
+    on_file_done(test_file, file_result) is called as soon as the last test
+    of a test file is finished.
+
+    With pytest option --test-durations (used for the run history) each file
+    result also gets a "tests" dict {test name: [outcome, duration]}.
+    """
+
+    def __init__(self, on_file_done=None):
+        self.results = {}
+        self.on_file_done = on_file_done
+        self.record_tests = False
+        self._last_nodeids = set()
+
+    def pytest_configure(self, config):
+        self.record_tests = config.getoption("test_durations", False)
+
+    def _file_result(self, nodeid):
+        test_file = nodeid.split("::")[0]
+        if test_file not in self.results:
+            self.results[test_file] = new_file_result()
+        return self.results[test_file]
+
+    def pytest_collectreport(self, report):
+        # test file that could not be imported (for example, SyntaxError in
+        # the task) has no tests, but must not be considered passed
+        if report.failed and report.nodeid:
+            file_result = self._file_result(report.nodeid)
+            file_result["errors"] += 1
+            self._add_failure(file_result, report)
+            if self.on_file_done:
+                self.on_file_done(report.nodeid.split("::")[0], file_result)
+
+    def pytest_collection_finish(self, session):
+        last_items = {}
+        for item in session.items:
+            last_items[item.nodeid.split("::")[0]] = item.nodeid
+        self._last_nodeids = set(last_items.values())
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        if self.on_file_done and nodeid in self._last_nodeids:
+            test_file = nodeid.split("::")[0]
+            self.on_file_done(test_file, self.results[test_file])
+
+    def _add_failure(self, file_result, report):
+        crash = getattr(report.longrepr, "reprcrash", None)
+        if crash:
+            message = crash.message
+        else:
+            # last line of the traceback: "E   SyntaxError: ..."
+            lines = report.longreprtext.strip().splitlines()
+            message = lines[-1].lstrip("E").strip() if lines else ""
+        first_line = message.splitlines()[0] if message else ""
+        file_result.setdefault("failures", []).append(f"{report.nodeid}: {first_line}")
+
+    def _add_test(self, file_result, report):
+        name = report.nodeid.split("::", 1)[-1]
+        test = file_result.setdefault("tests", {}).setdefault(name, ["passed", 0.0])
+        test[1] += report.duration
+        if report.when == "call":
+            test[0] = report.outcome
+        elif report.failed:
+            test[0] = "error"
+        elif report.skipped:
+            test[0] = "skipped"
+
+    def pytest_runtest_logreport(self, report):
+        file_result = self._file_result(report.nodeid)
+        file_result["duration"] += report.duration
+        if self.record_tests:
+            self._add_test(file_result, report)
+        if report.when == "call":
+            if report.passed:
+                file_result["passed"] += 1
+            elif report.failed:
+                file_result["failed"] += 1
+                self._add_failure(file_result, report)
+            else:
+                file_result["skipped"] += 1
+        elif report.failed:
+            # setup or teardown error
+            file_result["errors"] += 1
+            self._add_failure(file_result, report)
+        elif report.skipped:
+            file_result["skipped"] += 1
+
+
+def file_passed(file_result):
+    """
+    The test file is considered passed if it has tests and all of them passed.
+    """
+    not_passed = file_result["failed"] + file_result["skipped"]
+    return file_result["passed"] > 0 and not_passed + file_result["errors"] == 0
+
+
+def get_passed_tasks(results):
+    """
+    The function returns a list of test files in which all tests passed.
+    """
+    if not results:
+        return []
+    return [name for name, result in results.items() if file_passed(result)]
+
+
+def merge_results(results_list):
+    """
+    The function combines results of several test runs into one dict.
+    """
+    merged = {}
+    for results in results_list:
+        if results:
+            merged.update(results)
+    return merged
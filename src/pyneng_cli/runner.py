@@ -0,0 +1,122 @@
+import io
+import sys
+from contextlib import redirect_stdout
+
+import click
+
+from pyneng_cli import task_report, timings
+from pyneng_cli.result_cache import ResultCache
+from pyneng_cli.results import ResultsCollector, merge_results
+
+
+def run_pytest(test_files, pytest_args, plugins=None, on_file_done=None):
+    """
+    The function runs pytest for test_files in the current process and
+    returns the results for each test file (see ResultsCollector).
+    plugins are additional pytest plugin objects, on_file_done is called
+    for each test file as soon as it is finished.
+    """
+    # pytest is imported only when tests are run, so the commands that do not
+    # run tests (--help, --update, --save-all) start faster
+    with timings.span("import pytest", "imports"):
+        import pytest
+        from pyneng_cli import pytest_plugin
+
+    collector = ResultsCollector(on_file_done)
+    plugins = [collector, pytest_plugin, *(plugins or [])]
+    if timings.enabled():
+        plugins.append(timings.TimingsPlugin())
+    with timings.span("pytest run", "pytest"):
+        pytest.main(test_files + pytest_args, plugins=plugins)
+    return collector.results
+
+
+def _run_pytest_worker(test_file, pytest_args, timings_enabled=False):
+    """
+    Runs pytest for one test file in a worker process. The output is captured
+    so that the output of different files is not mixed up. The timings of
+    the worker are returned to the main process.
+    """
+    if timings_enabled:
+        timings.enable()
+        # events inherited from the main process with fork
+        timings.drain()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        results = run_pytest([test_file], pytest_args)
+    return results, output.getvalue(), timings.drain()
+
+
+def run_pytest_parallel(test_files, pytest_args, jobs, sandbox=None):
+    """
+    The function distributes test files across a pool of jobs processes (one
+    pytest run per test file) and returns the merged results. The output of
+    each file is printed in the order of test_files.
+
+    If sandbox (SandboxLimits) is set, each test file is run in a sandbox
+    worker with timeout and resource limits (see pyneng_cli.sandbox).
+    """
+    if sandbox:
+        from pyneng_cli.sandbox import run_pytest_sandboxed
+
+        if sys.stdout.isatty():
+            pytest_args = [*pytest_args, "--color=yes"]
+        return run_pytest_sandboxed(test_files, pytest_args, jobs, sandbox)
+    if jobs <= 1 or len(test_files) <= 1:
+        on_file_done = task_report.task_done if task_report.enabled() else None
+        return run_pytest(test_files, pytest_args, on_file_done=on_file_done)
+    from concurrent.futures import ProcessPoolExecutor
+
+    if sys.stdout.isatty():
+        pytest_args = [*pytest_args, "--color=yes"]
+    results_list = []
+    with ProcessPoolExecutor(max_workers=min(jobs, len(test_files))) as executor:
+        worker_results = executor.map(
+            _run_pytest_worker,
+            test_files,
+            [pytest_args] * len(test_files),
+            [timings.enabled()] * len(test_files),
+        )
+        for results, output, worker_timings in worker_results:
+            print(output, end="")
+            results_list.append(results)
+            timings.add_events(worker_timings)
+            for test_file, file_result in results.items():
+                task_report.task_done(test_file, file_result)
+    return merge_results(results_list)
+
+
+def run_pytest_cached(test_files, pytest_args, jobs, sandbox=None):
+    """
+    The function runs only the test files for which there is no cached
+    passed result (or the task/test file has changed since it was cached).
+    The cached results are merged into the results as if the tests were run.
+    """
+    result_cache = ResultCache()
+    cached_results = {}
+    dirty_test_files = []
+    for test_file in test_files:
+        cached = result_cache.get(test_file)
+        if cached:
+            # cached results are not added to the run history
+            cached_results[test_file] = {**cached, "cached": True}
+        else:
+            dirty_test_files.append(test_file)
+
+    if cached_results:
+        for test_file, cached in cached_results.items():
+            task_report.task_done(test_file, cached, cached=True)
+        cached_files = ", ".join(cached_results)
+        print(
+            click.style(
+                f"Unchanged since the last passed run (cached): {cached_files}",
+                fg="green",
+            )
+        )
+
+    results = None
+    if dirty_test_files:
+        results = run_pytest_parallel(dirty_test_files, pytest_args, jobs, sandbox)
+        result_cache.update(results)
+        result_cache.save()
+    return merge_results([cached_results, results])
@@ -0,0 +1,286 @@
+"""
+Sandboxed test execution: each test file is run in a separate worker
+process with a wall-clock timeout, CPU time and memory limits. A task that
+hangs or uses too much memory is reported as "timeout" or "resource-limit"
+instead of stopping the whole run.
+
+Worker processes are started with python -m pyneng_cli.sandbox, run test
+files one by one (requests and results are JSON lines on stdin/stdout) and
+are replaced with a new process after max_tasks_per_worker test files, so
+the memory of a worker does not grow indefinitely.
+"""
+
+import io
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+from contextlib import redirect_stdout
+
+import click
+
+from pyneng_cli import task_report, timings
+from pyneng_cli.results import new_file_result
+
+TIMEOUT_STATUS = "timeout"
+RESOURCE_LIMIT_STATUS = "resource-limit"
+CRASHED_STATUS = "crashed"
+# signals that mean that the worker was killed because of the limits:
+# RLIMIT_CPU (SIGXCPU), failed malloc with RLIMIT_AS (SIGABRT, SIGSEGV),
+# OOM killer (SIGKILL)
+RESOURCE_LIMIT_SIGNALS = {
+    getattr(signal, name)
+    for name in ("SIGXCPU", "SIGABRT", "SIGSEGV", "SIGKILL")
+    if hasattr(signal, name)
+}
+
+
+class SandboxLimits:
+    """
+    Limits for one test file: timeout (wall-clock seconds), cpu_seconds
+    (CPU time, by default equal to timeout), memory_mb (address space of the
+    worker process). max_tasks_per_worker - the number of test files after
+    which the worker is replaced with a new one.
+    """
+
+    def __init__(
+        self, timeout=60, memory_mb=1024, cpu_seconds=None, max_tasks_per_worker=10
+    ):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds or timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+
+
+def failed_file_result(status, duration=0.0):
+    result = new_file_result()
+    result["errors"] = 1
+    result["duration"] = duration
+    result["status"] = status
+    return result
+
+
+class SandboxWorker:
+    """
+    Worker process that runs test files in the directory cwd.
+    """
+
+    def __init__(self, limits, cwd=None):
+        self.limits = limits
+        self.tasks_done = 0
+        command = [sys.executable, "-m", "pyneng_cli.sandbox"]
+        if limits.memory_mb and os.name == "posix":
+            command.append(f"--memory-mb={limits.memory_mb}")
+        # the worker is the leader of a new process group (session), so the
+        # processes started by the tasks are killed together with it. Workers
+        # are started from several threads, so the limits are set by the
+        # worker itself instead of preexec_fn
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=os.name == "posix",
+            encoding="utf-8",
+        )
+        # results are read in a thread, so that the timeout works on all
+        # platforms (select does not work with pipes on Windows)
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=self._read_lines, daemon=True)
+        reader.start()
+
+    def _read_lines(self):
+        for line in self.process.stdout:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def run(self, test_file, pytest_args):
+        """
+        Runs test_file and returns (results, output). If the worker does not
+        respond within the timeout or dies, the worker is killed and the test
+        file gets timeout or resource-limit status.
+        """
+        request = {
+            "test_file": test_file,
+            "pytest_args": pytest_args,
+            "cpu_seconds": self.limits.cpu_seconds,
+        }
+        self.tasks_done += 1
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+            line = self.lines.get(timeout=self.limits.timeout)
+        except queue.Empty:
+            self.kill()
+            status = failed_file_result(TIMEOUT_STATUS, self.limits.timeout)
+            return {test_file: status}, ""
+        except OSError:
+            line = None
+        if line is None:
+            returncode = self.process.wait()
+            if -returncode in RESOURCE_LIMIT_SIGNALS:
+                status = RESOURCE_LIMIT_STATUS
+            else:
+                status = CRASHED_STATUS
+            return {test_file: failed_file_result(status)}, ""
+        response = json.loads(line)
+        return response["results"], response["output"]
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        """
+        Kills the worker and the processes started by the task.
+        """
+        if os.name == "posix":
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        else:
+            self.process.kill()
+        self.process.wait()
+
+    def close(self):
+        if self.is_alive():
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.kill()
+
+
+def run_pytest_sandboxed(test_files, pytest_args, jobs, limits):
+    """
+    The function runs test files in jobs sandbox workers and returns merged
+    results. The output of each test file is printed when it is finished.
+    """
+    files_queue = queue.Queue()
+    for test_file in test_files:
+        files_queue.put(test_file)
+    results = {}
+    print_lock = threading.Lock()
+    # workers are in their own process groups and do not get SIGINT from the
+    # terminal, so on Ctrl-C they are killed by the main thread
+    stop = threading.Event()
+    workers = set()
+
+    def worker_slot():
+        worker = None
+        while not stop.is_set():
+            try:
+                test_file = files_queue.get_nowait()
+            except queue.Empty:
+                break
+            if worker is None or not worker.is_alive():
+                worker = SandboxWorker(limits)
+                workers.add(worker)
+            with timings.span(f"tests {test_file}", "tests", sandbox=True):
+                file_results, output = worker.run(test_file, pytest_args)
+            if stop.is_set():
+                break
+            with print_lock:
+                print(output, end="")
+                for name, file_result in file_results.items():
+                    if "status" in file_result:
+                        status = file_result["status"]
+                        print(click.style(f"{name}: {status}", fg="red"))
+                    task_report.task_done(name, file_result)
+                results.update(file_results)
+            if worker.tasks_done >= limits.max_tasks_per_worker:
+                worker.close()
+                worker = None
+        if worker:
+            worker.close()
+
+    threads = [
+        threading.Thread(target=worker_slot)
+        for _ in range(min(max(jobs, 1), len(test_files)))
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for worker in list(workers):
+            if worker.is_alive():
+                worker.kill()
+        raise
+    return results
+
+
+class MemoryErrorDetector:
+    """
+    pytest plugin that detects MemoryError in tests (RLIMIT_AS exceeded).
+    """
+
+    def __init__(self):
+        self.memory_error = False
+
+    def pytest_exception_interact(self, node, call, report):
+        if call.excinfo and call.excinfo.errisinstance(MemoryError):
+            self.memory_error = True
+
+
+def _set_memory_limit(memory_mb):
+    import resource
+
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _set_cpu_limit(cpu_seconds):
+    """
+    RLIMIT_CPU is the limit of the CPU time of the whole process, so the soft
+    limit is set to the time already used by the worker plus cpu_seconds.
+    """
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + cpu_seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def worker_main(memory_mb=None):
+    if memory_mb:
+        _set_memory_limit(memory_mb)
+    from pyneng_cli.runner import run_pytest
+
+    # stdout is used for results, everything else that tasks print outside
+    # of pytest capture goes to stderr
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request["cpu_seconds"] and os.name == "posix":
+            _set_cpu_limit(request["cpu_seconds"])
+        output = io.StringIO()
+        detector = MemoryErrorDetector()
+        with redirect_stdout(output):
+            results = run_pytest(
+                [request["test_file"]], request["pytest_args"], plugins=[detector]
+            )
+        if detector.memory_error:
+            for file_result in results.values():
+                file_result["status"] = RESOURCE_LIMIT_STATUS
+        protocol.write(json.dumps({"results": results, "output": output.getvalue()}))
+        protocol.write("\n")
+        protocol.flush()
+
+
+if __name__ == "__main__":
+    memory_mb = None
+    for arg in sys.argv[1:]:
+        if arg.startswith("--memory-mb="):
+            memory_mb = int(arg.split("=", 1)[1])
+    worker_main(memory_mb)
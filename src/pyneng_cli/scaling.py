@@ -0,0 +1,204 @@
+"""
+Scaling check of 19_concurrent_connections tasks (pyneng --scaling).
+
+The function of a task is called with the devices of the simulator (see
+pyneng_cli.device_simulator) where each command takes LATENCY seconds, with
+limit (the number of threads/processes of the task function) 1, 2, 4 ... N.
+The time of each call gives the speedup (time with 1 worker / time with k
+workers) and the parallel efficiency (speedup / k). If the speedup with N
+workers is close to 1, the task most likely connects to devices one by one
+(for example, waits for each future right after submit) and is flagged as
+serialized.
+"""
+
+import importlib
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from pyneng_cli.utils import red, green
+
+SCALING_CHAPTER = "19_concurrent_connections"
+LATENCY = 0.2
+# speedup with N workers below this value means that the task does not work
+# with the devices in parallel
+SERIALIZED_SPEEDUP = 1.5
+
+
+def _show_command_kwargs(devices, filename):
+    return {"devices": devices, "command": "sh clock", "filename": filename}
+
+
+def _commands_dict_kwargs(devices, filename):
+    commands = {device["host"]: "sh clock" for device in devices}
+    return {"devices": devices, "commands_dict": commands, "filename": filename}
+
+
+def _show_or_config_kwargs(devices, filename):
+    return {"devices": devices, "filename": filename, "show": "sh clock"}
+
+
+# task file: (function name, function that returns the arguments of the
+# function except limit)
+SCALING_TASKS = {
+    "task_19_2.py": ("send_show_command_to_devices", _show_command_kwargs),
+    "task_19_3.py": ("send_command_to_devices", _commands_dict_kwargs),
+    "task_19_4.py": ("send_commands_to_devices", _show_or_config_kwargs),
+}
+
+
+def worker_counts(max_workers):
+    """
+    1, 2, 4 ... max_workers (max_workers is added if it is not a power of 2).
+    """
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def measure_scaling(function, build_kwargs, devices, max_workers):
+    """
+    Calls function with limit=1, 2, 4 ... max_workers and returns a dict
+    {workers: wall time in seconds}.
+    """
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for workers in worker_counts(max_workers):
+            kwargs = build_kwargs(devices, os.path.join(tmp_dir, f"{workers}.txt"))
+            start = time.perf_counter()
+            # the output of the task (for example, logging) is not needed
+            with redirect_stdout(io.StringIO()):
+                function(**kwargs, limit=workers)
+            timings[workers] = time.perf_counter() - start
+    return timings
+
+
+def scaling_summary(timings):
+    """
+    Returns a list of tuples (workers, time, speedup, efficiency) and
+    True if the task is serialized.
+    """
+    base = timings[1]
+    rows = [
+        (workers, elapsed, base / elapsed, base / elapsed / workers)
+        for workers, elapsed in timings.items()
+    ]
+    max_workers, _, max_speedup, _ = rows[-1]
+    serialized = max_workers > 1 and max_speedup < SERIALIZED_SPEEDUP
+    return rows, serialized
+
+
+def check_task_scaling(task_file, devices, max_workers):
+    """
+    Imports the task from the current directory and measures its scaling.
+    Returns a dict with timings or error.
+    """
+    function_name, build_kwargs = SCALING_TASKS[task_file]
+    module_name = task_file[:-3]
+    try:
+        if os.getcwd() not in sys.path:
+            sys.path.insert(0, os.getcwd())
+        module = importlib.import_module(module_name)
+        function = getattr(module, function_name)
+        timings = measure_scaling(function, build_kwargs, devices, max_workers)
+    except Exception as error:
+        return {"task": task_file, "error": f"{type(error).__name__}: {error}"}
+    rows, serialized = scaling_summary(timings)
+    return {"task": task_file, "rows": rows, "serialized": serialized}
+
+
+def check_chapter_scaling(task_files, max_workers, latency=LATENCY):
+    """
+    Starts the simulator with max_workers devices and checks the scaling of
+    the task_files of the current directory (only the tasks from
+    SCALING_TASKS are checked).
+    """
+    from pyneng_cli.device_simulator import DeviceSimulator
+
+    task_files = [task for task in task_files if task in SCALING_TASKS]
+    if not task_files:
+        return []
+    with DeviceSimulator(count=max_workers, latency=latency) as simulator:
+        protocol = "ssh" if simulator.ssh else "telnet"
+        devices = [device.netmiko_params(protocol) for device in simulator.devices]
+        return [
+            check_task_scaling(task_file, devices, max_workers)
+            for task_file in task_files
+        ]
+
+
+def print_scaling_result(result):
+    if "error" in result:
+        print(red(f"{result['task']}: {result['error']}"))
+        return
+    print(f"{result['task']}")
+    print("  workers      time   speedup  efficiency")
+    for workers, elapsed, speedup, efficiency in result["rows"]:
+        print(f"  {workers:7} {elapsed:8.2f}s {speedup:8.2f}x {efficiency:10.0%}")
+    workers, _, speedup, _ = result["rows"][-1]
+    if result["serialized"]:
+        print(
+            red(
+                f"  Serialized: speedup {speedup:.2f}x with {workers} workers, "
+                "devices are most likely processed one by one"
+            )
+        )
+    else:
+        print(green(f"  Speedup {speedup:.2f}x with {workers} workers"))
+
+
+def _scale_chapter(job):
+    """
+    Checks a chapter of a repository in a pool process (see scale_chapters).
+    """
+    repo_dir, chapter_dir, task_files, max_workers = job
+    os.chdir(chapter_dir)
+    return repo_dir, check_chapter_scaling(task_files, max_workers)
+
+
+def scale_chapters(chapter_jobs, max_workers):
+    """
+    Checks the scaling of the chapters of many repositories. chapter_jobs is
+    a list of tuples (repository directory, chapter directory, task files).
+    Chapters are checked one at a time (so that the measurements do not
+    affect each other), each in a new process. Prints the results and the
+    summary: speedup of each task or serialized/error (the summary is not
+    printed for the chapter of the current directory).
+    """
+    import multiprocessing
+
+    jobs = [
+        (repo_dir, chapter_dir, task_files, max_workers)
+        for repo_dir, chapter_dir, task_files in chapter_jobs
+    ]
+    summary = {}
+    with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+        for repo_dir, results in pool.imap(_scale_chapter, jobs):
+            if repo_dir != os.curdir:
+                print(green(f"\n{repo_dir}"))
+            for result in results:
+                print_scaling_result(result)
+            summary[repo_dir] = results
+
+    if list(summary) == [os.curdir]:
+        return summary
+    print("\nSummary:")
+    for repo_dir, results in summary.items():
+        columns = []
+        for result in results:
+            task = result["task"][:-3]
+            if "error" in result:
+                columns.append(f"{task} error")
+            elif result["serialized"]:
+                columns.append(f"{task} serialized")
+            else:
+                columns.append(f"{task} {result['rows'][-1][2]:.1f}x")
+        print(f"{repo_dir}: {', '.join(columns) or 'no tasks'}")
+    return summary
@@ -0,0 +1,121 @@
+"""
+Shared store of the tasks and answers repositories for a classroom.
+
+The store is a directory with bare mirrors of ANSWERS_URL and
+LANG_TASKS_URL repositories. Git objects are content-addressed: every object
+that is received from the store is hashed again by git and checked with
+transfer.fsckObjects, so a damaged or modified store can not produce wrong
+files.
+
+One machine downloads the repositories into the store:
+
+    pyneng --prefetch-store /mnt/course/pyneng-store
+
+The store is used from a shared mount or served over HTTP by pyneng itself:
+
+    pyneng --serve-store /mnt/course/pyneng-store --store-port 8000
+
+Students set PYNENG_STORE to the directory or URL of the store, and the
+local caches (GitRepoCache) are cloned and fetched from the store before
+GitHub.
+"""
+
+import os
+from urllib.parse import urlparse
+
+from pyneng_cli import ANSWERS_URL, LANG_TASKS_URL
+from pyneng_cli.git_backend import run_git
+
+STORE_GIT_CONFIG = {"transfer.fsckObjects": "true"}
+
+
+def mirror_name(url):
+    """
+    Name of the mirror of url in the store:
+    https://github.com/natenka/pynenguk-tasks -> github.com/natenka/pynenguk-tasks.git
+    """
+    parsed = urlparse(url)
+    name = f"{parsed.netloc}/{parsed.path.strip('/')}".strip("/")
+    if not name.endswith(".git"):
+        name += ".git"
+    return name
+
+
+def is_http(url):
+    return url.startswith(("http://", "https://"))
+
+
+def store_url(store, url):
+    """
+    URL of the mirror of url in store (directory or HTTP URL).
+    """
+    if is_http(store):
+        return f"{store.rstrip('/')}/{mirror_name(url)}"
+    path = os.path.join(os.path.abspath(store), mirror_name(url))
+    # file:// so that git uses the same protocol as with GitHub (shallow
+    # clones and filters) instead of copying the mirror
+    return f"file://{path}"
+
+
+def store_sources(store, url):
+    """
+    Returns a list of tuples (source URL, git config, shallow) to get url
+    from: the store first, then the repository itself. The store is served
+    over HTTP as static files (dumb HTTP), which does not support shallow
+    clones.
+    """
+    sources = []
+    if store:
+        source = store_url(store, url)
+        sources.append((source, STORE_GIT_CONFIG, not is_http(source)))
+    sources.append((url, None, True))
+    return sources
+
+
+def store_repo_urls():
+    return [ANSWERS_URL, *dict.fromkeys(LANG_TASKS_URL.values())]
+
+
+def prefetch_store(store_dir, urls=None):
+    """
+    Creates or updates the bare mirrors of the repositories in store_dir.
+    """
+    from pyneng_cli.repo_cache import git_error
+
+    for url in urls or store_repo_urls():
+        path = os.path.join(store_dir, mirror_name(url))
+        if os.path.isdir(path):
+            print(f"Updating {path}")
+            result = run_git(["remote", "update", "--prune"], cwd=path)
+        else:
+            print(f"Downloading {url} to {path}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            result = run_git(["clone", "--quiet", "--mirror", url, path])
+        if result.returncode != 0:
+            raise git_error(result.stderr)
+        # shallow clones with filters from file:// mirrors
+        run_git(["config", "uploadpack.allowFilter", "true"], cwd=path)
+        # info/refs and objects/info/packs for the clients over HTTP
+        run_git(["update-server-info"], cwd=path)
+
+
+def serve_store(store_dir, port=8000):
+    """
+    Serves store_dir over HTTP (git dumb HTTP protocol needs only static
+    files) until Ctrl-C.
+    """
+    from functools import partial
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    handler = partial(SimpleHTTPRequestHandler, directory=store_dir)
+    server = ThreadingHTTPServer(("", port), handler)
+    print(
+        f"Serving pyneng store {store_dir} on port {port}. "
+        f"Students set PYNENG_STORE=http://<this host>:{port}. Press Ctrl-C to stop"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        server.server_close()
@@ -0,0 +1,201 @@
+import os
+import re
+
+from pyneng_cli import TASK_NUMBER_DIR_MAP
+
+TASK_FILE_REGEX = re.compile(
+    r"(?P<kind>test_|answer_)?task_(?P<chapter>\d+)_(?P<number>\d+)(?P<letter>[a-z]?)\.py"
+)
+CHAPTER_SELECTOR_REGEX = re.compile(
+    r"(?P<all>all)|"
+    r"(?P<number_star>\d+\*)|"
+    r"(?P<letters_range>\d+[a-z]-[a-z])|"
+    r"(?P<numbers_range>\d+-\d+)|"
+    r"(?P<single_task>\d+[a-z]?)"
+)
+CROSS_CHAPTER_SELECTOR_REGEX = re.compile(
+    r"(?P<chapter_star>\d+\.\*)|"
+    r"(?P<tasks_range>\d+\.\d+[a-z]?-\d+\.\d+[a-z]?)|"
+    r"(?P<chapter_task>\d+\.\d+[a-z]?)"
+)
+FILE_KINDS = {None: "task", "test_": "test", "answer_": "answer"}
+
+
+def split_selector(value):
+    return [token for token in re.split(r"[ ,]+", value) if token]
+
+
+def parse_task_id(value):
+    """
+    Converts task id string 2a (or 4.2a with chapter) to tuple (2, "a").
+    """
+    match = re.fullmatch(r"(\d+)([a-z]?)", value)
+    return int(match.group(1)), match.group(2)
+
+
+def is_cross_chapter_selector(value):
+    tokens = split_selector(value)
+    return bool(tokens) and all(
+        CROSS_CHAPTER_SELECTOR_REGEX.fullmatch(token) for token in tokens
+    )
+
+
+class TaskIndex:
+    """
+    Index of task, test and answer files of a chapter directory.
+
+    The directory is scanned once, each task id (number, letter) is mapped to
+    its files: {(2, "a"): {"task": "task_4_2a.py", "test": "test_task_4_2a.py",
+    "answer": "answer_task_4_2a.py"}}. All task selectors are resolved
+    against the index without accessing the file system.
+    """
+
+    def __init__(self, chapter_dir, chapter_id):
+        self.chapter_dir = chapter_dir
+        self.chapter_id = chapter_id
+        self.tasks = {}
+        with os.scandir(chapter_dir) as entries:
+            for entry in entries:
+                match = TASK_FILE_REGEX.fullmatch(entry.name)
+                if not match or int(match.group("chapter")) != chapter_id:
+                    continue
+                task_id = int(match.group("number")), match.group("letter")
+                kind = FILE_KINDS[match.group("kind")]
+                self.tasks.setdefault(task_id, {})[kind] = entry.name
+
+    def select_ids(self, token):
+        """
+        Returns a list of task ids for one selector (1, 2a, 1-3, 2a-c, 2*, all).
+        Raises ValueError if the selector format is not supported.
+        """
+        match = CHAPTER_SELECTOR_REGEX.fullmatch(token)
+        if not match:
+            raise ValueError(token)
+        if match.group("all"):
+            return list(self.tasks)
+        elif match.group("number_star"):
+            number = int(token[:-1])
+            return [task_id for task_id in self.tasks if task_id[0] == number]
+        elif match.group("letters_range"):
+            number, first_letter = parse_task_id(token[:-2])
+            last_letter = token[-1]
+            return [
+                (n, letter)
+                for n, letter in self.tasks
+                if n == number and letter and first_letter <= letter <= last_letter
+            ]
+        elif match.group("numbers_range"):
+            start, stop = map(int, token.split("-"))
+            return [
+                (n, letter)
+                for n, letter in self.tasks
+                if not letter and start <= n <= stop
+            ]
+        else:
+            task_id = parse_task_id(token)
+            return [task_id] if task_id in self.tasks else []
+
+    def test_file_for(self, filename):
+        """
+        Returns the test file that checks the task or test file filename or
+        None if there is no such test file in the chapter.
+        """
+        match = TASK_FILE_REGEX.fullmatch(filename)
+        if not match or match.group("kind") == "answer_":
+            return None
+        task_id = int(match.group("number")), match.group("letter")
+        return self.tasks.get(task_id, {}).get("test")
+
+    def files(self, task_ids):
+        """
+        Returns test files, tasks without tests and task files for task ids
+        (the same tuple that _get_tasks_tests_from_cli returns).
+        """
+        test_files, tasks_without_tests, task_files = [], [], []
+        for task_id in sorted(set(task_ids)):
+            files = self.tasks[task_id]
+            if "test" in files:
+                test_files.append(files["test"])
+            if "task" in files:
+                task_files.append(files["task"])
+                if "test" not in files:
+                    tasks_without_tests.append(files["task"])
+        return test_files, tasks_without_tests, task_files
+
+    def select(self, value):
+        task_ids = []
+        for token in split_selector(value):
+            task_ids += self.select_ids(token)
+        return self.files(task_ids)
+
+
+class ExercisesIndex:
+    """
+    Index of the chapters of the exercises directory for cross-chapter
+    selectors: 4.1 (task 4.1), 4.* (all tasks of chapter 4), 4.1-5.3 (tasks
+    from 4.1 to 5.3 including tasks with letters). Chapters are scanned only
+    if they are needed for the selector.
+    """
+
+    def __init__(self, exercises_dir="."):
+        self.exercises_dir = exercises_dir
+        self.chapters = {}
+        with os.scandir(exercises_dir) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name in TASK_NUMBER_DIR_MAP.values():
+                    chapter_id = int(entry.name.split("_")[0])
+                    self.chapters[chapter_id] = entry.name
+        self._indexes = {}
+
+    def chapter_index(self, chapter_id):
+        if chapter_id not in self._indexes:
+            chapter_dir = os.path.join(self.exercises_dir, self.chapters[chapter_id])
+            self._indexes[chapter_id] = TaskIndex(chapter_dir, chapter_id)
+        return self._indexes[chapter_id]
+
+    def _select_range(self, start, stop):
+        selected = {}
+        for chapter_id in sorted(self.chapters):
+            if not start[0] <= chapter_id <= stop[0]:
+                continue
+            index = self.chapter_index(chapter_id)
+            selected[chapter_id] = [
+                task_id
+                for task_id in index.tasks
+                if start <= (chapter_id, *task_id) <= stop
+            ]
+        return selected
+
+    def select(self, value):
+        """
+        Returns a dict {chapter directory name: (test files, tasks without
+        tests, task files)} for the chapters that have selected tasks.
+        Raises ValueError if the selector format is not supported.
+        """
+        selected_ids = {}
+        for token in split_selector(value):
+            match = CROSS_CHAPTER_SELECTOR_REGEX.fullmatch(token)
+            if not match:
+                raise ValueError(token)
+            if match.group("chapter_star"):
+                chapter_id = int(token.split(".")[0])
+                if chapter_id in self.chapters:
+                    selected = {chapter_id: list(self.chapter_index(chapter_id).tasks)}
+                else:
+                    selected = {}
+            else:
+                first, _, last = token.partition("-")
+                last = last or first
+                start, stop = [
+                    (int(chapter), *parse_task_id(task_id))
+                    for chapter, task_id in (first.split("."), last.split("."))
+                ]
+                selected = self._select_range(start, stop)
+            for chapter_id, task_ids in selected.items():
+                selected_ids.setdefault(chapter_id, []).extend(task_ids)
+
+        return {
+            self.chapters[chapter_id]: self.chapter_index(chapter_id).files(task_ids)
+            for chapter_id, task_ids in sorted(selected_ids.items())
+            if task_ids
+        }
@@ -0,0 +1,219 @@
+"""
+Machine-readable report of a pyneng run for pyneng --report-file.
+
+One record is written for each task as soon as its tests are finished (the
+file is flushed after each record), so the report can be read while the
+tests are still running. Formats:
+
+* jsonl - one JSON object per line:
+  {"task": "4.2a", "repo": null, "chapter": "04_data_structures",
+   "test_file": "test_task_4_2a.py", "task_file": "task_4_2a.py",
+   "outcome": "failed", "duration": 0.02,
+   "cached": false, "failures": ["test_task_4_2a.py::test_x: assert 1 == 2"]}
+* junit - JUnit XML with one testcase per task
+
+repo is the repository directory of the chapter with --grade ("." for the
+chapters of the exercises directory) and null in a chapter directory.
+
+Records are written only in the main pyneng process. The pool processes of
+--grade and pyneng all collect the records of their chapter (see
+collect_records) and return them to the main process.
+"""
+
+import json
+import os
+import threading
+
+from pyneng_cli.task_index import TASK_FILE_REGEX
+
+REPORT_FORMATS = ["jsonl", "junit"]
+_writer = None
+
+
+def task_outcome(file_result):
+    """
+    Outcome of the task by the counters of its test file: passed, failed,
+    error, skipped or the sandbox status (timeout, resource-limit, crashed).
+    """
+    if file_result.get("status"):
+        return file_result["status"]
+    elif file_result["errors"]:
+        return "error"
+    elif file_result["failed"]:
+        return "failed"
+    elif file_result["passed"] and not file_result["skipped"]:
+        return "passed"
+    return "skipped"
+
+
+def task_id(test_file):
+    """
+    Task id of the test file: test_task_4_2a.py -> 4.2a
+    """
+    match = TASK_FILE_REGEX.fullmatch(os.path.basename(test_file))
+    if not match:
+        return test_file
+    return f"{match.group('chapter')}.{match.group('number')}{match.group('letter')}"
+
+
+def task_record(test_file, file_result, chapter, cached=False, repo=None):
+    return {
+        "task": task_id(test_file),
+        "repo": repo,
+        "chapter": chapter,
+        "test_file": test_file,
+        "task_file": os.path.basename(test_file).replace("test_", "", 1),
+        "outcome": task_outcome(file_result),
+        "duration": round(file_result["duration"], 6),
+        "cached": cached,
+        "failures": file_result.get("failures", []),
+    }
+
+
+class JsonlReportWriter:
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        pass
+
+
+class JUnitReportWriter:
+    """
+    Writes testcase elements as the tasks are finished. The numbers of tests
+    and failures are not known in advance, so they are not added to the
+    testsuite element.
+    """
+
+    def __init__(self, file):
+        # xml.sax.saxutils imports urllib, it is needed only for junit. It is
+        # imported before the tests: an import in the main process while the
+        # --grade pool forks a new process can deadlock the new process
+        from xml.sax import saxutils
+
+        self.saxutils = saxutils
+        self.file = file
+        self.file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        self.file.write('<testsuites>\n<testsuite name="pyneng">\n')
+
+    def write(self, record):
+        quoteattr, escape = self.saxutils.quoteattr, self.saxutils.escape
+        classname = record["chapter"]
+        if record["repo"] is not None:
+            classname = os.path.join(record["repo"], classname)
+        self.file.write(
+            f"<testcase classname={quoteattr(classname)} "
+            f"name={quoteattr(record['task_file'])} "
+            f'time="{record["duration"]:.6f}"'
+        )
+        outcome = record["outcome"]
+        if outcome == "passed":
+            self.file.write("/>\n")
+            return
+        self.file.write(">")
+        message = record["failures"][0] if record["failures"] else outcome
+        if outcome == "failed":
+            tag = "failure"
+        elif outcome == "skipped":
+            tag = "skipped"
+        else:
+            tag = "error"
+        self.file.write(
+            f"<{tag} type={quoteattr(outcome)} message={quoteattr(message)}>"
+            f"{escape(chr(10).join(record['failures']))}</{tag}>"
+        )
+        self.file.write("</testcase>\n")
+
+    def close(self):
+        self.file.write("</testsuite>\n</testsuites>\n")
+
+
+WRITERS = {"jsonl": JsonlReportWriter, "junit": JUnitReportWriter}
+
+
+class TaskReport:
+    def __init__(self, filename, report_format):
+        self.file = open(filename, "w", encoding="utf-8")
+        self.writer = WRITERS[report_format](self.file)
+        # pool processes (fork) must not inherit the buffered header
+        self.file.flush()
+        self._lock = threading.Lock()
+
+    def task_done(self, test_file, file_result, cached=False):
+        record = task_record(
+            test_file, file_result, os.path.basename(os.getcwd()), cached
+        )
+        self.write_records([record])
+
+    def write_records(self, records):
+        # sandbox workers report from several threads
+        with self._lock:
+            for record in records:
+                self.writer.write(record)
+            self.file.flush()
+
+    def close(self):
+        self.writer.close()
+        self.file.close()
+
+
+class RecordsCollector:
+    """
+    Collects the records of a chapter in a pool process.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.records = []
+
+    def task_done(self, test_file, file_result, cached=False):
+        chapter = os.path.basename(os.getcwd())
+        self.records.append(
+            task_record(test_file, file_result, chapter, cached, self.repo)
+        )
+
+    def close(self):
+        pass
+
+
+def open_report(filename, report_format="jsonl"):
+    global _writer
+    _writer = TaskReport(filename, report_format)
+
+
+def collect_records(repo):
+    """
+    Makes the records of this process collected instead of written (the
+    report file inherited from the main process with fork is not used).
+    Returns the list of the records.
+    """
+    global _writer
+    _writer = RecordsCollector(repo)
+    return _writer.records
+
+
+def write_records(records):
+    """
+    Writes the records collected in a pool process.
+    """
+    if _writer is not None and records:
+        _writer.write_records(records)
+
+
+def enabled():
+    return _writer is not None
+
+
+def task_done(test_file, file_result, cached=False):
+    if _writer is not None:
+        _writer.task_done(test_file, file_result, cached)
+
+
+def close_report():
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
@@ -0,0 +1,240 @@
+"""
+Cache of parsed TextFSM templates and compiled Jinja2 templates for the tests
+of 20_jinja2 and 21_textfsm chapters.
+
+The tests of these chapters call the functions of the tasks many times, and
+each call parses the same TextFSM template (textfsm.TextFSM) or creates a new
+Jinja2 Environment that compiles the same template again. install() (called
+by the pyneng pytest plugin) makes:
+
+* TextFSM reuse the parsed states and values of a template with the same
+  content (the values are copied for each TextFSM object, so the objects do
+  not share the parsing state). The cache depends on private attributes of
+  TextFSM and is not used if textfsm_supported() is False
+* every Jinja2 Environment without its own bytecode_cache use
+  TemplateBytecodeCache: the code of compiled templates is kept in memory
+  and in CACHE_DIR/templates, which is shared by pyneng runs and worker
+  processes
+
+Both in-memory caches are LRU caches of CACHE_SIZE templates, the keys are
+hashes of the template content.
+"""
+
+import functools
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import textfsm
+from jinja2 import Environment
+from jinja2.bccache import Bucket, FileSystemBytecodeCache
+
+from pyneng_cli import CACHE_DIR
+
+TEMPLATE_CACHE_DIR = os.path.join(CACHE_DIR, "templates")
+CACHE_SIZE = 256
+_installed = False
+
+
+class LRUCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def _copy(obj, **attrs):
+    new = object.__new__(type(obj))
+    new.__dict__.update(obj.__dict__, **attrs)
+    return new
+
+
+def _copy_values(values, fsm):
+    """
+    Copies TextFSMValue objects and their options for fsm. The state of the
+    values (current value, Filldown and List data) is cleared by
+    TextFSM.Reset, so shallow copies are enough.
+    """
+    copies = []
+    for value in values:
+        new_value = _copy(value, fsm=fsm)
+        new_value.options = [_copy(option, value=new_value) for option in value.options]
+        copies.append(new_value)
+    return copies
+
+
+_textfsm_cache = LRUCache()
+_textfsm_parse = getattr(textfsm.TextFSM, "_Parse", None)
+TEXTFSM_PROBE_TEMPLATE = "Value Filldown INTF (\\S+)\n\nStart\n  ^${INTF} -> Record\n"
+
+
+def textfsm_supported():
+    """
+    The cache uses private attributes of TextFSM, which can change in another
+    textfsm version. They are checked by parsing a small template, TextFSM is
+    not patched if some of them are missing.
+    """
+    if _textfsm_parse is None:
+        return False
+    try:
+        fsm = textfsm.TextFSM(io.StringIO(TEXTFSM_PROBE_TEMPLATE))
+        (value,) = fsm.values
+        (option,) = value.options
+        return (
+            isinstance(fsm.states, dict)
+            and isinstance(fsm.state_list, list)
+            and isinstance(fsm.value_map, dict)
+            and value.fsm is fsm
+            and option.value is value
+            and fsm._options_cls is not None
+        )
+    except Exception:
+        return False
+
+
+def _parse_cached(fsm, template, key):
+    parsed = _textfsm_cache.get(key)
+    if parsed is None:
+        _textfsm_parse(fsm, template)
+        parsed = (
+            fsm.states,
+            fsm.state_list,
+            fsm.value_map,
+            _copy_values(fsm.values, None),
+        )
+        _textfsm_cache.put(key, parsed)
+        return
+    fsm.states, fsm.state_list, fsm.value_map, values = parsed
+    fsm.values = _copy_values(values, fsm)
+
+
+def _cached_textfsm_parse(self, template):
+    """
+    Replaces TextFSM._Parse. TextFSM.__init__ rewinds the template file after
+    parsing.
+    """
+    try:
+        content = template.read()
+        template.seek(0)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return _textfsm_parse(self, template)
+    if isinstance(content, str):
+        content = content.encode()
+    try:
+        key = hashlib.sha1(content).hexdigest(), self._options_cls
+        _parse_cached(self, template, key)
+    except AttributeError:
+        # the template is parsed without the cache as in TextFSM.__init__
+        self.states, self.state_list, self.values, self.value_map = {}, [], [], {}
+        template.seek(0)
+        _textfsm_parse(self, template)
+
+
+def environment_key(environment):
+    """
+    Settings of the environment that change the compiled code of a template.
+    Returns None if the environment has callable autoescape or finalize: the
+    code depends on them and they can not be compared.
+    """
+    if callable(environment.autoescape) or environment.finalize is not None:
+        return None
+    return (
+        environment.block_start_string,
+        environment.block_end_string,
+        environment.variable_start_string,
+        environment.variable_end_string,
+        environment.comment_start_string,
+        environment.comment_end_string,
+        environment.line_statement_prefix,
+        environment.line_comment_prefix,
+        environment.trim_blocks,
+        environment.lstrip_blocks,
+        environment.newline_sequence,
+        environment.keep_trailing_newline,
+        environment.optimized,
+        environment.is_async,
+        environment.autoescape,
+        tuple(sorted(environment.extensions)),
+    )
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """
+    Jinja2 bytecode cache with the code of the templates in memory (LRU) and
+    in directory. The key is the hash of the template source, name and
+    environment_key. Templates of environments without environment_key are
+    compiled as usual.
+    """
+
+    def __init__(self, directory=TEMPLATE_CACHE_DIR, maxsize=CACHE_SIZE):
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            pass
+        super().__init__(directory)
+        self.memory = LRUCache(maxsize)
+
+    def get_bucket(self, environment, name, filename, source):
+        settings = environment_key(environment)
+        if settings is None:
+            return Bucket(environment, None, "")
+        key = hashlib.sha1(repr((name, settings)).encode())
+        key.update(source.encode("utf-8"))
+        bucket = Bucket(environment, key.hexdigest(), self.get_source_checksum(source))
+        code = self.memory.get(bucket.key)
+        if code is not None:
+            bucket.code = code
+            return bucket
+        self.load_bytecode(bucket)
+        if bucket.code is not None:
+            self.memory.put(bucket.key, bucket.code)
+        return bucket
+
+    def set_bucket(self, bucket):
+        if bucket.key is None:
+            return
+        self.memory.put(bucket.key, bucket.code)
+        try:
+            self.dump_bytecode(bucket)
+        except OSError:
+            # the directory cache is optional, the code stays in memory
+            pass
+
+
+def install(cache_dir=TEMPLATE_CACHE_DIR):
+    """
+    Enables the caches in this process (repeated calls do nothing).
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    if textfsm_supported():
+        textfsm.TextFSM._Parse = _cached_textfsm_parse
+
+    bytecode_cache = TemplateBytecodeCache(cache_dir)
+    environment_init = Environment.__init__
+
+    @functools.wraps(environment_init)
+    def __init__(self, *args, **kwargs):
+        environment_init(self, *args, **kwargs)
+        if self.bytecode_cache is None:
+            self.bytecode_cache = bytecode_cache
+
+    Environment.__init__ = __init__
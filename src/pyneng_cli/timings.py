@@ -0,0 +1,177 @@
+"""
+Timing instrumentation of pyneng phases (imports, pytest collection, tests
+of each task, git subprocesses, answers, push) for pyneng --timings.
+
+The code is instrumented with span:
+
+    with timings.span("git push"):
+        ...
+
+When timings are disabled, span returns the same no-op context manager, so
+the instrumented code pays only for one function call. When enabled, the
+spans are recorded and at the end of the run a ranked breakdown is printed
+and optionally a Chrome trace event file is written (it can be opened in
+chrome://tracing or https://ui.perfetto.dev).
+
+Only the standard library is imported in this module.
+"""
+
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+_NULL_SPAN = nullcontext()
+_recorder = None
+# imports of pyneng_cli.pyneng are measured before the command line is
+# parsed, so they are saved even if timings are not enabled
+_imports = None
+
+
+def now_us():
+    return time.perf_counter() * 1_000_000
+
+
+def record_imports(start_us, end_us):
+    global _imports
+    _imports = start_us, end_us
+
+
+class TimingsRecorder:
+    """
+    Collects spans in Chrome trace event format (complete events "X").
+    """
+
+    def __init__(self):
+        self.start = now_us()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, name, category, start_us, end_us, args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start_us,
+            "dur": end_us - start_us,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+
+class Span:
+    def __init__(self, recorder, name, category, args):
+        self.recorder = recorder
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = now_us()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.add(self.name, self.category, self.start, now_us(), self.args)
+
+
+def enable():
+    global _recorder
+    if _recorder is None:
+        _recorder = TimingsRecorder()
+        if _imports:
+            _recorder.add("import pyneng", "imports", *_imports)
+
+
+def enabled():
+    return _recorder is not None
+
+
+def span(name, category="phase", **args):
+    if _recorder is None:
+        return _NULL_SPAN
+    return Span(_recorder, name, category, args)
+
+
+def drain():
+    """
+    Returns the events recorded in this process and clears them (used to pass
+    the events of worker processes to the main process).
+    """
+    if _recorder is None:
+        return []
+    with _recorder._lock:
+        events, _recorder.events = _recorder.events, []
+    return events
+
+
+def add_events(events):
+    if _recorder is not None and events:
+        with _recorder._lock:
+            _recorder.events.extend(events)
+
+
+class TimingsPlugin:
+    """
+    pytest plugin that records test collection and the tests of each test
+    file (each test is a separate span, the breakdown sums them per file).
+    """
+
+    def pytest_collection(self, session):
+        self.collection_start = now_us()
+
+    def pytest_collection_finish(self, session):
+        _recorder.add("pytest collection", "pytest", self.collection_start, now_us())
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        self.test_start = now_us()
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        test_file = nodeid.split("::")[0]
+        _recorder.add(
+            f"tests {test_file}", "tests", self.test_start, now_us(), {"test": nodeid}
+        )
+
+
+def print_breakdown(top=25):
+    """
+    Prints the spans grouped by name, sorted by total time. Spans can be
+    nested (pytest run includes collection) or run in parallel worker
+    processes (-j), so the percents of the total time do not sum to 100.
+    """
+    total = now_us() - _recorder.start
+    if _imports:
+        total += _recorder.start - _imports[0]
+    summary = {}
+    for event in _recorder.events:
+        count, duration = summary.get(event["name"], (0, 0))
+        summary[event["name"]] = count + 1, duration + event["dur"]
+    ranked = sorted(summary.items(), key=lambda item: item[1][1], reverse=True)
+    print(f"\nTimings (total {total / 1000:.1f} ms):")
+    for name, (count, duration) in ranked[:top]:
+        percent = duration / total * 100
+        print(f"{duration / 1000:10.1f} ms {percent:5.1f}% {count:5}x  {name}")
+    if len(ranked) > top:
+        print(f"... {len(ranked) - top} more")
+
+
+def write_chrome_trace(filename):
+    import json
+
+    with open(filename, "w") as f:
+        json.dump({"traceEvents": _recorder.events, "displayTimeUnit": "ms"}, f)
+
+
+def finish(trace_file=None):
+    """
+    Prints the breakdown and writes the trace file (if trace_file is set).
+    """
+    if _recorder is None:
+        return
+    print_breakdown()
+    if trace_file:
+        write_chrome_trace(trace_file)
+        print(f"Chrome trace written to {trace_file}")
@@ -1,22 +1,19 @@
-import subprocess
-from platform import system as system_name
 import re
 import os
-from collections import defaultdict
-import tempfile
 import pathlib
 import stat
 import shutil
-from datetime import datetime, timedelta
+import threading
 
 import click
-import github
-from rich import print as rprint
-from rich.padding import Padding
 
-from pyneng_cli.exceptions import PynengError
+from pyneng_cli import timings
+from pyneng_cli.chapter_sync import ChapterSyncState, sync_chapter
+from pyneng_cli.git_backend import GitBackend
+from pyneng_cli.repo_cache import GitRepoCache
 from pyneng_cli import (
     ANSWERS_URL,
+    ANSWERS_LOCAL_REPO,
     TASK_DIRS,
     DB_TASK_DIRS,
     TASKS_URL,
@@ -43,77 +40,33 @@ def remove_readonly(func, path, _):
     func(path)
 
 
-def call_command(command, verbose=True, return_stdout=False, return_stderr=False):
-    """
-    The function invokes the specified command via subprocess and outputs
-    stdout and stderr if the verbose flag is True.
-    """
-    result = subprocess.run(
-        command,
-        shell=True,
-        encoding="utf-8",
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    std = result.stdout
-    stderr = result.stderr
-    if return_stdout:
-        return std
-    if return_stderr:
-        return result.returncode, stderr
-    if verbose:
-        print("#" * 20, command)
-        if std:
-            print(std)
-        if stderr:
-            print(stderr)
-    return result.returncode
-
-
-def working_dir_clean():
-    git_status = call_command("git status --porcelain", return_stdout=True)
-    if git_status:
-        return False
-    else:
-        return True
+def working_dir_clean(git=None):
+    git = git or GitBackend()
+    return git.is_clean()
 
 
-def show_git_diff_short():
-    git_diff = call_command("git diff --stat")
-
-
-def git_push(branch):
-    """
-    The function calls git push on Windows
-    """
-    command = f"git push origin {branch}"
-    print("#" * 20, command)
-    result = subprocess.run(command, shell=True)
+def show_git_diff_short(git=None):
+    git = git or GitBackend()
+    git.show_diff_stat()
 
 
 def save_changes_to_github(
-    message="All changes saved", git_add_all=True, branch="main"
+    message="All changes saved", git_add_all=True, branch="main", git=None
 ):
-    status = call_command("git status -s", return_stdout=True)
-    if not status:
-        return
-    if git_add_all:
-        call_command("git add .")
-    call_command(f'git commit -m "{message}"')
-    windows = True if system_name().lower() == "windows" else False
-
-    if windows:
-        git_push(branch)
-    else:
-        call_command(f"git push origin {branch}")
+    git = git or GitBackend()
+    with timings.span("save changes to GitHub"):
+        git.save_changes(message, git_add_all=git_add_all, branch=branch)
 
 
-def current_chapter_id():
+def current_chapter_id(chapter_dir=None):
     """
     The function returns the number of the current task chapter where pyneng is
-    called.
+    called (or the chapter in chapter_dir).
     """
-    current_chapter_name = current_dir_name()
+    if chapter_dir:
+        current_chapter_name = os.path.basename(os.path.abspath(chapter_dir))
+    else:
+        current_chapter_name = current_dir_name()
     if current_chapter_name in DB_TASK_DIRS:
         current_chapter_name = TASK_DIRS[-1]
     current_chapter = int(current_chapter_name.split("_")[0])
@@ -126,73 +79,92 @@ def current_dir_name():
     return current_chapter_name
 
 
-def parse_json_report(report):
+def answers_repo_cache():
+    homedir = pathlib.Path.home()
+    return GitRepoCache(ANSWERS_URL, homedir / ANSWERS_LOCAL_REPO)
+
+
+def fetch_answers(chapter_name):
     """
-    Selects the desired parts from the pytest run report in JSON format.
-    Returns a list of tests that passed.
+    The function updates the local answers cache (shallow clone that contains
+    only the chapter) and returns it.
     """
-    if report and report["summary"]["total"] != 0:
-        all_tests = defaultdict(list)
-        summary = report["summary"]
-
-        test_names = [test["nodeid"] for test in report["collectors"][0]["result"]]
-        for test in report["tests"]:
-            name = test["nodeid"].split("::")[0]
-            all_tests[name].append(test["outcome"] == "passed")
-        all_passed_tasks = [name for name, outcome in all_tests.items() if all(outcome)]
-        return all_passed_tasks
-    else:
-        return []
+    answers_repo = answers_repo_cache()
+    with timings.span("fetch answers"):
+        answers_repo.sync([f"answers/{chapter_name}"])
+    return answers_repo
 
 
-def git_clone_repo(repo_url, dst_dir):
-    returncode, stderr = call_command(
-        f"git clone {repo_url} {dst_dir}",
-        verbose=False,
-        return_stderr=True,
-    )
-    if returncode != 0:
-        if "could not resolve host" in stderr.lower():
-            raise PynengError(
-                red(
-                    "Failed to clone the repository. Maybe you don't have internet access?"
-                )
-            )
-        else:
-            raise PynengError(red(f"Failed to copy files. {stderr}"))
+class AnswersFetch(threading.Thread):
+    """
+    fetch_answers in a daemon thread. pyneng does not wait for the fetch when
+    it exits without copying the answers (for example, no task passed the
+    tests), and an error of the fetch is raised only by result, when the
+    answers are needed.
+    """
+
+    def __init__(self, chapter_name):
+        super().__init__(name="fetch-answers", daemon=True)
+        self.chapter_name = chapter_name
+        self._answers_repo = None
+        self._error = None
+
+    def run(self):
+        try:
+            self._answers_repo = fetch_answers(self.chapter_name)
+        except BaseException as error:
+            self._error = error
+
+    def result(self):
+        """
+        Waits for the fetch and returns the answers cache.
+        """
+        self.join()
+        if self._error:
+            raise self._error
+        return self._answers_repo
+
+
+def start_fetch_answers():
+    """
+    The function starts fetch_answers for the current chapter in the
+    background, so that the answers are downloaded while the tests are
+    running. Returns AnswersFetch that is passed to copy_answers.
+    """
+    answers_fetch = AnswersFetch(current_dir_name())
+    answers_fetch.start()
+    return answers_fetch
 
 
-def copy_answers(passed_tasks):
+def copy_answers(passed_tasks, answers_fetch=None):
     """
-    The function clones the answer repository and copies the answers for tasks
-    that pass the tests.
+    The function copies the answers for tasks that pass the tests from the
+    local answers cache. If answers_fetch (AnswersFetch from start_fetch_answers)
+    is passed, waits for it instead of updating the cache.
     """
     pth = str(pathlib.Path().absolute())
     current_chapter_name = os.path.split(pth)[-1]
-    current_chapter_number = int(current_chapter_name.split("_")[0])
 
-    homedir = pathlib.Path.home()
-    os.chdir(homedir)
-    if os.path.exists("pyneng-answers"):
-        shutil.rmtree("pyneng-answers", onerror=remove_readonly)
-    git_clone_repo(ANSWERS_URL, "pyneng-answers")
-    os.chdir(os.path.join("pyneng-answers", "answers", current_chapter_name))
-    copy_answer_files(passed_tasks, pth)
+    with timings.span("copy answers"):
+        if answers_fetch:
+            answers_repo = answers_fetch.result()
+        else:
+            answers_repo = fetch_answers(current_chapter_name)
+        copy_answer_files(passed_tasks, pth, answers_repo, current_chapter_name)
     print(
         green(
             "\nAnswers to tasks that passed the tests are copied to the files "
             "answer_task_x.py\n"
         )
     )
-    os.chdir(homedir)
-    shutil.rmtree("pyneng-answers", onerror=remove_readonly)
-    os.chdir(pth)
 
 
-def copy_answer_files(passed_tasks, pth):
+def copy_answer_files(passed_tasks, pth, answers_repo, chapter_name):
     """
-    The function copies the answers for the specified tasks.
+    The function copies the answers for the specified tasks. The answers are
+    read from git objects of the answers cache.
     """
+    answer_files = {}
     for test_file in passed_tasks:
         task_name = test_file.replace("test_", "")
         task_name = re.search(r"task_\w+\.py", task_name).group()
@@ -200,37 +172,51 @@ def copy_answer_files(passed_tasks, pth):
         answer_name = re.search(r"answer_task_\w+\.py", answer_name).group()
         pth_answer = os.path.join(pth, answer_name)
         if not os.path.exists(pth_answer):
-            shutil.copy2(task_name, pth_answer)
+            answer_files[f"answers/{chapter_name}/{task_name}"] = pth_answer
 
+    answers = answers_repo.read_files(answer_files)
+    for repo_file, pth_answer in answer_files.items():
+        if repo_file in answers:
+            with open(pth_answer, "wb") as f:
+                f.write(answers[repo_file])
 
-def clone_or_pull_task_repo():
-    source_pth = str(pathlib.Path().absolute())
-    homedir = pathlib.Path.home()
-    os.chdir(homedir)
-    if os.path.exists(TASKS_LOCAL_REPO):
-        os.chdir(TASKS_LOCAL_REPO)
-        call_command("git pull")
-        os.chdir(homedir)
+
+def tasks_repo_cache(lang=None):
+    """
+    The function returns the local cache of the tasks repository for the
+    specified language (by default for the currently selected language).
+    """
+    if lang:
+        url, local_repo = LANG_TASKS_URL[lang], LANG_TASKS_LOCAL_REPO[lang]
     else:
-        git_clone_repo(TASKS_URL, TASKS_LOCAL_REPO)
-    os.chdir(source_pth)
+        url, local_repo = TASKS_URL, TASKS_LOCAL_REPO
+    homedir = pathlib.Path.home()
+    return GitRepoCache(url, homedir / local_repo)
+
+
+def clone_or_pull_task_repo(chapters):
+    """
+    The function makes a shallow clone of the tasks repository (or fetches
+    updates if the local copy is older than CACHE_TTL) and checks out only the
+    specified chapters.
+    """
+    tasks_repo = tasks_repo_cache()
+    with timings.span("fetch tasks"):
+        tasks_repo.sync([f"exercises/{chapter}" for chapter in chapters])
+    return tasks_repo
 
 
 def copy_tasks_tests_from_repo(tasks, tests):
     """
-    The function clones the repository with the latest version of tasks and
-    copies the specified tasks to the current directory.
+    The function updates the local copy of the tasks repository and copies
+    the specified tasks to the current directory.
     """
     source_pth = str(pathlib.Path().absolute())
     current_chapter_name = os.path.split(source_pth)[-1]
-    current_chapter_number = int(current_chapter_name.split("_")[0])
 
-    clone_or_pull_task_repo()
+    tasks_repo = clone_or_pull_task_repo([current_chapter_name])
 
-    homedir = pathlib.Path.home()
-    os.chdir(
-        os.path.join(homedir, TASKS_LOCAL_REPO, "exercises", current_chapter_name)
-    )
+    os.chdir(os.path.join(tasks_repo.path, "exercises", current_chapter_name))
     copy_task_test_files(source_pth, tasks, tests)
     print(green("\nUpdated tasks and tests copied"))
     os.chdir(source_pth)
@@ -249,8 +235,8 @@ def copy_task_test_files(source_pth, tasks=None, tests=None):
         shutil.copy2(file, os.path.join(source_pth, file))
 
 
-def save_working_dir(branch="main"):
-    if not working_dir_clean():
+def save_working_dir(branch="main", git=None):
+    if not working_dir_clean(git):
         print(
             red(
                 "Updating tests and tasks will overwrite the contents of unsaved files!".upper()
@@ -264,7 +250,7 @@ def save_working_dir(branch="main"):
         )
         if user_input.strip().lower() not in ("n", "no"):
             save_changes_to_github(
-                "Saving changes before updating tasks", branch=branch
+                "Saving changes before updating tasks", branch=branch, git=git
             )
             print(
                 green(
@@ -273,9 +259,9 @@ def save_working_dir(branch="main"):
             )
 
 
-def working_dir_changed_diff(branch="main"):
+def working_dir_changed_diff(branch="main", git=None):
     print(red("The following files have been updated:"))
-    show_git_diff_short()
+    show_git_diff_short(git)
     print(
         "\nThis is a short diff, if you want to see all the differences in detail, "
         "press n and run git diff command.\nYou can also undo your changes with "
@@ -284,7 +270,7 @@ def working_dir_changed_diff(branch="main"):
 
     user_input = input(red("\nSave changes and add to github? [y/n]: "))
     if user_input.strip().lower() not in ("n", "no"):
-        save_changes_to_github("Updating tasks", branch=branch)
+        save_changes_to_github("Updating tasks", branch=branch, git=git)
 
 
 def change_tasks_lang(lang):
@@ -296,49 +282,50 @@ def change_tasks_lang(lang):
 
 def update_tasks_and_tests(tasks_list, tests_list, lang, branch="main"):
     change_tasks_lang(lang)
-    save_working_dir(branch=branch)
+    # git status and diff only for the current chapter directory
+    git = GitBackend()
+    save_working_dir(branch=branch, git=git)
     copy_tasks_tests_from_repo(tasks_list, tests_list)
-    if working_dir_clean():
+    git.invalidate()
+    if working_dir_clean(git):
         print(green("Tasks and tests are already the latest version"))
         return False
     else:
-        working_dir_changed_diff(branch=branch)
+        working_dir_changed_diff(branch=branch, git=git)
         return True
 
 
 def update_chapters_tasks_and_tests(update_chapters, lang, branch="main"):
     change_tasks_lang(lang)
-    save_working_dir(branch=branch)
+    # git status and diff only for the updated chapters
+    git = GitBackend(paths=update_chapters)
+    save_working_dir(branch=branch, git=git)
     copy_chapters_from_repo(update_chapters)
-    if working_dir_clean():
+    git.invalidate()
+    if working_dir_clean(git):
         print(green("All chapters are up to date"))
         return False
     else:
-        working_dir_changed_diff(branch=branch)
+        working_dir_changed_diff(branch=branch, git=git)
         return True
 
 
 def copy_chapters_from_repo(chapters_list):
     """
-    The function clones the repository with the latest version of tasks and
-    copies the specified tasks to the current directory.
+    The function updates the local copy of the tasks repository and copies
+    the specified chapters to the current directory.
     """
     source_pth = str(pathlib.Path().absolute())
-    clone_or_pull_task_repo()
-
-    homedir = pathlib.Path.home()
-    os.chdir(os.path.join(homedir, TASKS_LOCAL_REPO, "exercises"))
-    copy_chapters(source_pth, chapters_list)
+    tasks_repo = clone_or_pull_task_repo(chapters_list)
+    copy_chapters(source_pth, chapters_list, tasks_repo)
     print(green("\nUpdated sections copied"))
-    os.chdir(source_pth)
 
 
-def copy_chapters(source_pth, chapters_list):
+def copy_chapters(source_pth, chapters_list, tasks_repo):
     """
-    Function copies chapters
+    Function copies chapters. Only the files changed in the tasks repository
+    since the previous update of the chapter are copied.
     """
+    sync_state = ChapterSyncState(source_pth)
     for chapter in chapters_list:
-        to_path = os.path.join(source_pth, chapter)
-        if os.path.exists(to_path):
-            shutil.rmtree(to_path)
-        shutil.copytree(chapter, to_path)
+        sync_chapter(tasks_repo, source_pth, chapter, sync_state)
@@ -0,0 +1,164 @@
+import os
+import select
+import struct
+import sys
+import time
+
+from pyneng_cli.result_cache import ResultCache
+from pyneng_cli.results import get_passed_tasks
+from pyneng_cli.runner import run_pytest
+from pyneng_cli.task_index import TaskIndex
+from pyneng_cli.utils import red, green, current_chapter_id
+
+# inotify constants from sys/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_CLOEXEC = os.O_CLOEXEC
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# time to wait for other events of the same save (editors often write a file
+# in several steps)
+DEBOUNCE_INTERVAL = 0.1
+POLL_INTERVAL = 0.5
+
+
+class InotifyWatcher:
+    """
+    Watches the directory with Linux inotify (via ctypes, without additional
+    dependencies). Raises OSError if inotify is not available.
+    """
+
+    def __init__(self, path):
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is available only on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def _read_events(self):
+        data = os.read(self.fd, 64 * 1024)
+        names = set()
+        position = 0
+        while position < len(data):
+            _, _, _, name_len = INOTIFY_EVENT.unpack_from(data, position)
+            position += INOTIFY_EVENT.size
+            name = data[position : position + name_len].rstrip(b"\0")
+            position += name_len
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def changes(self):
+        """
+        Generator that returns a set of changed file names for each save.
+        """
+        while True:
+            select.select([self.fd], [], [])
+            names = self._read_events()
+            while select.select([self.fd], [], [], DEBOUNCE_INTERVAL)[0]:
+                names |= self._read_events()
+            yield names
+
+
+class PollingWatcher:
+    """
+    Watches the directory by comparing mtime and size of the files every
+    interval seconds (used where inotify is not available).
+    """
+
+    def __init__(self, path, interval=POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.snapshot = self._snapshot()
+
+    def _snapshot(self):
+        with os.scandir(self.path) as entries:
+            return {
+                entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size)
+                for entry in entries
+                if entry.is_file()
+            }
+
+    def changes(self):
+        while True:
+            time.sleep(self.interval)
+            snapshot = self._snapshot()
+            names = {
+                name
+                for name, stat in snapshot.items()
+                if self.snapshot.get(name) != stat
+            }
+            self.snapshot = snapshot
+            if names:
+                yield names
+
+
+def get_watcher(path):
+    try:
+        return InotifyWatcher(path)
+    except (OSError, AttributeError):
+        return PollingWatcher(path)
+
+
+def forget_chapter_modules(chapter_path):
+    """
+    Removes the modules imported from the chapter directory (tasks and
+    tests) from sys.modules, so that the next pytest run imports the new
+    version of the files.
+    """
+    for name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None)
+        if (
+            module_file
+            and os.path.dirname(os.path.abspath(module_file)) == chapter_path
+        ):
+            del sys.modules[name]
+
+
+def watch_chapter(test_files, pytest_args, chapter_dir="."):
+    """
+    The function watches the chapter directory and after each save of a task
+    or test file re-runs only the test file of this task. Only the tasks from
+    test_files are watched (conftest.py change re-runs all of them).
+    pytest stays imported in this process, so the results appear quickly.
+    """
+    # pytest is imported once before the first change
+    import pytest
+
+    chapter_path = os.path.abspath(chapter_dir)
+    chapter_id = current_chapter_id(chapter_dir)
+    watched_tests = set(test_files)
+    watcher = get_watcher(chapter_path)
+    print(green(f"\nWatching {chapter_path} for changes. Press Ctrl-C to exit"))
+    try:
+        for names in watcher.changes():
+            if "conftest.py" in names:
+                changed_tests = watched_tests
+            else:
+                index = TaskIndex(chapter_dir, chapter_id)
+                changed_tests = {index.test_file_for(name) for name in names}
+                changed_tests &= watched_tests
+            if not changed_tests:
+                continue
+            forget_chapter_modules(chapter_path)
+            results = run_pytest(sorted(changed_tests), pytest_args)
+            result_cache = ResultCache(chapter_path)
+            result_cache.update(results)
+            result_cache.save()
+            passed_tasks = get_passed_tasks(results)
+            for test_file in sorted(changed_tests):
+                if test_file in passed_tasks:
+                    print(green(f"{test_file} passed"))
+                else:
+                    print(red(f"{test_file} failed"))
+    except KeyboardInterrupt:
+        print()